@@ -0,0 +1,103 @@
+# =================================================================
+#  AGRÉGATION PARALLÈLE DES GRANDS DATAFRAMES DE REPORTING
+# =================================================================
+# Le DataFrame est découpé en tranches de lignes ; chaque processus du pool
+# reçoit sa tranche (seules les colonnes utiles) et fait lui-même tout le
+# travail coûteux : codage des clés (factorize du groupby) et agrégat
+# partiel (effectifs, sommes, nombres de valeurs). Le processus Streamlit ne
+# fait que découper, puis regrouper les résultats partiels (une ligne par
+# groupe et par tranche). En dessous de PARALLEL_MIN_ROWS lignes, ou avec un
+# seul processus, le coût de lancement dépasse le gain : on garde le groupby
+# pandas.
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+COUNT_COLUMN = 'Compte'
+PARALLEL_MIN_ROWS = int(os.getenv("PARALLEL_MIN_ROWS", "200000"))
+
+
+def available_cpus():
+    """Cœurs réellement accordés au processus (et non ceux de la machine)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS, Windows
+        return os.cpu_count() or 1
+
+
+PARALLEL_WORKERS = int(os.getenv("PARALLEL_WORKERS", "0")) or available_cpus()
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn : sûr depuis un serveur multi-thread (Streamlit) ; le pool est réutilisé d'un appel à l'autre
+        _executor = ProcessPoolExecutor(max_workers=PARALLEL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _reset_executor():
+    """Pool cassé (processus tué, manque de mémoire) : abandonné, un nouveau sera créé au prochain appel"""
+    global _executor
+    if _executor is not None: _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+def split_ranges(nb_rows, parts):
+    """Tranches [début, fin) de tailles égales (à une ligne près)"""
+    bounds = np.linspace(0, nb_rows, parts + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def partial_aggregate(part, keys, value=None):
+    """Exécuté dans le pool : effectifs de lignes (count) ou somme et nombre de valeurs par groupe d'une tranche"""
+    grouped = part.groupby(keys, observed=True)
+    if value is None: return grouped.size().to_frame(COUNT_COLUMN)
+    return grouped[value].agg(['sum', 'count'])
+
+
+def merge_partials(partials, keys):
+    """Regroupe les agrégats partiels (les mêmes groupes peuvent venir de plusieurs tranches)"""
+    return pd.concat(partials).groupby(level=list(range(len(keys))), observed=True).sum()
+
+
+def _pandas_aggregate(df, keys, value, how):
+    if how == 'count':
+        return df.groupby(keys, observed=True).size().reset_index(name=COUNT_COLUMN)
+    return df.groupby(keys, observed=True)[value].agg(how).reset_index()
+
+
+def aggregate(df, keys, value=None, how='count', workers=None, min_rows=None):
+    """
+    Équivalent de df.groupby(keys).size() (how='count') ou de
+    df.groupby(keys)[value].agg(how) (how='mean' / 'sum'), réparti sur
+    plusieurs processus pour les grands DataFrames.
+    """
+    workers = workers or PARALLEL_WORKERS
+    min_rows = PARALLEL_MIN_ROWS if min_rows is None else min_rows
+    if workers < 2 or len(df) < min_rows or len(df) == 0 or (how != 'count' and not pd.api.types.is_numeric_dtype(df[value])):
+        return _pandas_aggregate(df, keys, value, how)
+
+    columns = list(keys) + ([value] if how != 'count' else [])
+    partial_value = value if how != 'count' else None
+    try:
+        executor = _get_executor()
+        futures = [executor.submit(partial_aggregate, df.iloc[start:stop][columns], list(keys), partial_value)
+                   for start, stop in split_ranges(len(df), workers)]
+        merged = merge_partials([f.result() for f in futures], keys)
+    except BrokenProcessPool:
+        _reset_executor()
+        return _pandas_aggregate(df, keys, value, how)
+
+    if how == 'count':
+        return merged[COUNT_COLUMN].reset_index()
+    # Sommes partielles dans le type de la colonne (entier reste entier), comme le groupby pandas
+    result = merged['sum'] if how == 'sum' else merged['sum'] / merged['count']
+    return result.rename(value).reset_index()
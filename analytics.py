@@ -0,0 +1,282 @@
+"""
+Moteur analytique embarqué (DuckDB) sur une copie locale en colonnes des
+entretiens décodés.
+
+Les agrégats des tableaux de bord (group-by, quantiles, tableaux croisés)
+sont calculés sur l'hôte de l'application, en parallèle sur tous les cœurs,
+sans charger la base transactionnelle. La copie est rattrapée au plus une
+fois par ANALYTICS_SYNC_INTERVAL secondes : lignes nouvelles (num > dernier
+num copié) et lignes modifiées (colonne maj, tenue par un trigger), lues
+par lots avec un curseur côté serveur. Elle est reconstruite entièrement si
+des entretiens ont été supprimés ou si le décodage (configuration) a changé.
+
+Dépendance optionnelle : sans duckdb, is_available() est faux et les
+graphiques restent calculés par pandas.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from psycopg2.extras import RealDictCursor
+
+import backend
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+ANALYTICS_PATH = os.getenv("ANALYTICS_PATH", ".analytics/entretiens.duckdb")
+
+TABLE = "entretien"
+COUNT_COLUMN = "Compte"
+AGGREGATIONS = {'count': "COUNT(*)", 'mean': "AVG({col})", 'sum': "SUM({col})"}
+QUANTILE_COLUMNS = ['min', 'q1', 'mediane', 'q3', 'max', 'nb']
+
+SYNC_NONE = 'rien'
+SYNC_INCREMENT = 'increment'
+SYNC_FULL = 'complet'
+
+# Délai minimal entre deux rattrapages (les relances de page entre-temps ne touchent pas PostgreSQL)
+ANALYTICS_SYNC_INTERVAL = float(os.getenv("ANALYTICS_SYNC_INTERVAL", "60"))
+SYNC_BATCH_ROWS = 5000
+# Recouvrement de la fenêtre des lignes modifiées : une transaction validée après la
+# synchronisation précédente peut porter un horodatage maj légèrement antérieur
+SYNC_OVERLAP = timedelta(minutes=5)
+
+_connection = None
+# Une seule synchronisation à la fois (sessions Streamlit = threads)
+_lock = threading.Lock()
+_last_sync = {'at': None}
+
+
+def is_available():
+    return duckdb is not None
+
+
+def get_connection():
+    global _connection
+    if duckdb is None: return None
+    if _connection is None:
+        if ANALYTICS_PATH != ':memory:':
+            os.makedirs(os.path.dirname(ANALYTICS_PATH) or '.', exist_ok=True)
+        _connection = duckdb.connect(ANALYTICS_PATH)
+    return _connection
+
+
+# =================================================================
+#  SYNCHRONISATION DEPUIS POSTGRESQL
+# =================================================================
+
+def maps_version(vars_map, decodage_map):
+    """Empreinte du décodage : une modalité renommée impose de tout recopier"""
+    payload = json.dumps([sorted(vars_map.items()), sorted((str(k), sorted(v.items())) for k, v in decodage_map.items())],
+                         default=str)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def plan_sync(meta, version, remote):
+    """
+    Décide du rattrapage. meta = état local (None si jamais synchronisé) ;
+    remote = {'nb': lignes distantes de num <= filigrane, 'max_num', 'max_maj'}
+    """
+    if meta is None or meta['version'] != version: return SYNC_FULL
+    # Moins de lignes distantes sous le filigrane qu'en local : suppressions (ou année archivée)
+    if remote['nb'] != meta['nb']: return SYNC_FULL
+    if remote['max_num'] > meta['watermark']: return SYNC_INCREMENT
+    # Lignes modifiées depuis (rattachement des communes, correction)
+    if remote['max_maj'] is not None and (meta['maj'] is None or remote['max_maj'] > meta['maj']): return SYNC_INCREMENT
+    return SYNC_NONE
+
+
+def _read_meta(con):
+    con.execute("CREATE TABLE IF NOT EXISTS sync_etat (watermark BIGINT, nb BIGINT, version VARCHAR, maj VARCHAR)")
+    row = con.execute("SELECT watermark, nb, version, maj FROM sync_etat").fetchone()
+    if not row: return None
+    return {'watermark': row[0], 'nb': row[1], 'version': row[2], 'maj': datetime.fromisoformat(row[3]) if row[3] else None}
+
+
+def _local_columns(con):
+    rows = con.execute("SELECT column_name FROM information_schema.columns WHERE table_name = ? ORDER BY ordinal_position",
+                       [TABLE]).fetchall()
+    return [row[0] for row in rows]
+
+
+def normalize_batch(batch, var_types):
+    """
+    Types fixés par les métadonnées et identiques d'un lot à l'autre : une
+    colonne vide dans le premier lot ne doit pas être typée en entier.
+    """
+    for col in batch.columns:
+        if col == 'num': continue
+        if col == 'date_ent':
+            batch[col] = pd.to_datetime(batch[col], errors='coerce')
+        elif col in backend.GEO_COLUMNS or var_types.get(col, {}).get('type') == 'NUM':
+            batch[col] = pd.to_numeric(batch[col], errors='coerce').astype('float64')
+        else:
+            batch[col] = batch[col].astype('string')
+    return batch
+
+
+def _write_batch(con, batch, mode):
+    con.register('lot', batch)
+    try:
+        if not _local_columns(con):
+            con.execute(f"CREATE TABLE {TABLE} AS SELECT * FROM lot")
+            return
+        if mode == SYNC_INCREMENT:
+            # Lignes modifiées : l'ancienne version est remplacée
+            con.execute(f"DELETE FROM {TABLE} WHERE num IN (SELECT num FROM lot)")
+        con.execute(f"INSERT INTO {TABLE} BY NAME SELECT * FROM lot")
+    finally:
+        con.unregister('lot')
+
+
+def _copy(con, pg, mode, meta, maps, version):
+    """
+    Copie par lots (curseur côté serveur) dans une seule transaction locale.
+    Renvoie le nombre de lignes copiées, None si un incrément apporte de
+    nouvelles colonnes (variable ajoutée : copie complète nécessaire).
+    """
+    vars_map, decodage_map, var_types = maps
+    server = pg.cursor(name='analytics_sync', cursor_factory=RealDictCursor, withhold=True)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if mode == SYNC_FULL:
+            con.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            server.execute("SELECT * FROM entretien")
+        else:
+            since = meta['maj'] - SYNC_OVERLAP if meta['maj'] else None
+            server.execute("SELECT * FROM entretien WHERE num > %s OR maj > %s", (meta['watermark'], since))
+        copied, max_maj = 0, meta['maj'] if meta and mode == SYNC_INCREMENT else None
+        while True:
+            rows = server.fetchmany(SYNC_BATCH_ROWS)
+            if not rows: break
+            raw = pd.DataFrame(rows)
+            if backend.CHANGE_COLUMN in raw.columns:
+                batch_maj = raw[backend.CHANGE_COLUMN].max()
+                max_maj = batch_maj if max_maj is None or batch_maj > max_maj else max_maj
+            batch = normalize_batch(backend.decode_entretiens(backend.expand_attributes(raw, var_types), vars_map, decodage_map),
+                                    var_types)
+            if mode == SYNC_INCREMENT and not set(batch.columns) <= set(_local_columns(con)):
+                con.execute("ROLLBACK")
+                return None
+            _write_batch(con, batch, mode)
+            copied += len(batch)
+
+        watermark, nb = 0, 0
+        if _local_columns(con):
+            watermark, nb = con.execute(f"SELECT COALESCE(MAX(num), 0), COUNT(*) FROM {TABLE}").fetchone()
+        con.execute("DELETE FROM sync_etat")
+        con.execute("INSERT INTO sync_etat VALUES (?, ?, ?, ?)",
+                    [watermark, nb, version, max_maj.isoformat() if max_maj is not None else None])
+        con.execute("COMMIT")
+        return copied
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        server.close()
+
+
+def sync(force=False):
+    """
+    Rattrape la copie locale (au plus une fois par ANALYTICS_SYNC_INTERVAL
+    secondes, sauf force) ; renvoie le nombre de lignes copiées (0 : rien à
+    faire), None si indisponible ou en erreur.
+    """
+    con = get_connection()
+    if con is None: return None
+    if not force and _last_sync['at'] is not None and time.monotonic() - _last_sync['at'] < ANALYTICS_SYNC_INTERVAL:
+        return 0
+    pg = backend.get_reporting_connection()
+    if pg is None: return None
+    with _lock:
+        cursor = pg.cursor(cursor_factory=RealDictCursor)
+        try:
+            maps = backend.get_decoding_maps(cursor)
+            version = maps_version(maps[0], maps[1])
+            meta = _read_meta(con)
+            cursor.execute("SELECT COUNT(*) FILTER (WHERE num <= %s) AS nb, COALESCE(MAX(num), 0) AS max_num, "
+                           "MAX(maj) AS max_maj FROM entretien", (meta['watermark'] if meta else 0,))
+            mode = plan_sync(meta, version, cursor.fetchone())
+            copied = 0
+            if mode != SYNC_NONE:
+                copied = _copy(con, pg, mode, meta, maps, version)
+                # Nouvelle colonne côté PostgreSQL (variable ajoutée) : copie complète
+                if copied is None: copied = _copy(con, pg, SYNC_FULL, meta, maps, version)
+            _last_sync['at'] = time.monotonic()
+            return copied
+        except Exception as e:
+            print("❌ ERREUR SYNCHRO ANALYTIQUE :", e)
+            return None
+        finally:
+            cursor.close()
+
+
+# =================================================================
+#  REQUÊTES ANALYTIQUES
+# =================================================================
+
+def quote_column(name, columns):
+    """Identifiant SQL d'une colonne connue de la copie locale (jamais de texte libre dans le SQL)"""
+    if name not in columns: raise ValueError(f"Colonne inconnue : {name}")
+    return '"' + name.replace('"', '""') + '"'
+
+
+def build_aggregate_query(keys, columns, value=None, how='count'):
+    """Group-by sur keys ; la valeur est convertie en nombre (TRY_CAST) avant AVG / SUM"""
+    cols = [quote_column(k, columns) for k in keys]
+    if how == 'count':
+        measure, alias = AGGREGATIONS['count'], COUNT_COLUMN
+    else:
+        measure, alias = AGGREGATIONS[how].format(col=f"TRY_CAST({quote_column(value, columns)} AS DOUBLE)"), value
+    select = ", ".join(cols + [f'{measure} AS "{alias}"'])
+    group = ", ".join(cols)
+    return f"SELECT {select} FROM {TABLE} GROUP BY {group} ORDER BY {group}"
+
+
+def build_quantile_query(value, columns, by=()):
+    """Résumé d'une boîte à moustache (min, quartiles, max) par groupe"""
+    val = f"TRY_CAST({quote_column(value, columns)} AS DOUBLE)"
+    cols = [quote_column(b, columns) for b in by]
+    stats = [f"MIN({val}) AS min", f"quantile_cont({val}, 0.25) AS q1", f"median({val}) AS mediane",
+             f"quantile_cont({val}, 0.75) AS q3", f"MAX({val}) AS max", f"COUNT({val}) AS nb"]
+    sql = f"SELECT {', '.join(cols + stats)} FROM {TABLE} WHERE {val} IS NOT NULL"
+    if cols: sql += f" GROUP BY {', '.join(cols)} ORDER BY {', '.join(cols)}"
+    return sql
+
+
+def _run(build, *args, **kwargs):
+    con = get_connection()
+    if con is None: return None
+    cursor = con.cursor()
+    try:
+        columns = _local_columns(cursor)
+        if not columns: return None
+        return cursor.execute(build(*args, columns=columns, **kwargs)).df()
+    except Exception as e:
+        print("❌ ERREUR REQUÊTE ANALYTIQUE :", e)
+        return None
+    finally:
+        cursor.close()
+
+
+def aggregate(keys, value=None, how='count'):
+    """Équivalent de df.groupby(keys)[value].agg(how) ; None si le moteur est indisponible"""
+    return _run(build_aggregate_query, keys, value=value, how=how)
+
+
+def quantiles(value, by=()):
+    return _run(build_quantile_query, value, by=by)
+
+
+def crosstab(row, col):
+    """Tableau croisé des effectifs row x col"""
+    counts = aggregate([row, col])
+    if counts is None: return None
+    return counts.pivot_table(index=row, columns=col, values=COUNT_COLUMN, fill_value=0, aggfunc='sum')
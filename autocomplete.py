@@ -0,0 +1,63 @@
+# =================================================================
+#  INDEX DE PRÉFIXES POUR L'AUTOCOMPLÉTION DES CHAMPS CHAINE
+# =================================================================
+# Tableau trié des formes "repliées" (sans accents, sans casse, espaces
+# normalisés) : une recherche de préfixe est une dichotomie (bisect) qui
+# borne la plage des résultats, sans aucun accès à la base. Les champs
+# concernés sont hors du st.form de saisie : chaque saisie relance la page
+# et met à jour les suggestions ; la valeur retenue est ramenée à son
+# libellé de référence.
+
+import unicodedata
+from bisect import bisect_left
+
+# Plus grand caractère : borne haute de la plage des clés commençant par un préfixe
+MAX_CHAR = '\U0010ffff'
+
+
+def fold_text(text):
+    """'  Béganne ' -> 'beganne' : forme de comparaison insensible aux accents et à la casse"""
+    if text is None: return ""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(without_accents.casefold().split())
+
+
+def build_index(values):
+    """
+    Index trié de libellés. En cas de doublon replié ("Vannes" / "VANNES "),
+    le premier libellé rencontré est gardé : on passe la liste officielle
+    (valeurs_c) avant les valeurs saisies.
+    """
+    labels = {}
+    for value in values:
+        key = fold_text(value)
+        if key and key not in labels:
+            labels[key] = " ".join(str(value).split())
+    keys = sorted(labels)
+    return {'keys': keys, 'labels': [labels[k] for k in keys]}
+
+
+def complete(index, prefix, limit=10):
+    """Libellés dont la forme repliée commence par celle de prefix (ordre alphabétique replié)"""
+    key = fold_text(prefix)
+    if not key: return []
+    keys = index['keys']
+    start = bisect_left(keys, key)
+    stop = min(bisect_left(keys, key + MAX_CHAR, lo=start), start + limit)
+    return index['labels'][start:stop]
+
+
+def canonical(index, text):
+    """Libellé de référence d'une saisie ("nantes " -> "Nantes"), sinon la saisie nettoyée"""
+    key = fold_text(text)
+    if not key: return None
+    keys = index['keys']
+    i = bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        return index['labels'][i]
+    return " ".join(str(text).split())
+
+
+def all_labels(index):
+    return list(index['labels'])
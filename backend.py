@@ -1,8 +1,15 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_batch, Json
 from datetime import date
 import pandas as pd
+import json
+import time
 import os  # <--- AJOUT IMPORTANT : Permet de lire les variables système
+import geo
+import dtype_plan
+import validation
+import autocomplete
+import partitions
 
 # --- PARAMÈTRES DE CONNEXION ---
 # On utilise os.getenv('NOM_VARIABLE', 'valeur_par_defaut')
@@ -13,6 +20,14 @@ PG_DB = os.getenv("PG_DB", "db_maisondudroits")
 PG_USER = os.getenv("PG_USER", "pgis")
 PG_PASSWORD = os.getenv("PG_PASSWORD", "pgis") # <--- C'est cette ligne qui corrige l'erreur
 
+# --- CONNEXION DE REPORTING (lecture seule) ---
+# Les lectures lourdes (tableaux de bord) passent par une connexion dédiée,
+# idéalement vers un réplica ou un rôle en lecture seule :
+#   PG_REPORTING_DSN="host=replica port=5432 dbname=db_maisondudroits user=lecteur"
+# Sans DSN, on ouvre une seconde connexion vers la base principale.
+PG_REPORTING_DSN = os.getenv("PG_REPORTING_DSN", "")
+PG_REPORTING_TIMEOUT_MS = int(os.getenv("PG_REPORTING_TIMEOUT_MS", "30000"))
+
 # --- INITIALISATION DE LA CONNEXION ---
 def init_connection():
     try:
@@ -26,35 +41,375 @@ def init_connection():
         return None 
 
 
+def init_reporting_connection():
+    try:
+        options = f"-c statement_timeout={PG_REPORTING_TIMEOUT_MS}"
+        if PG_REPORTING_DSN:
+            conn = psycopg2.connect(PG_REPORTING_DSN, options=options)
+        else:
+            conn = psycopg2.connect(
+                host=PG_HOST, port=PG_PORT, database=PG_DB,
+                user=PG_USER, password=PG_PASSWORD, options=options
+            )
+        # Lecture seule + autocommit : aucune transaction ne reste ouverte
+        # et aucun verrou n'est pris sur les tables de saisie.
+        conn.set_session(readonly=True, autocommit=True)
+        return conn
+    except Exception:
+        return None
+
+
 # On initialise la variable globale ici
 connection = init_connection()
+reporting_connection = init_reporting_connection()
+
+def reconnect():
+    """Rouvre les connexions globales fermées (coupure réseau, redémarrage de PostgreSQL) ; utilisé par le worker"""
+    global connection, reporting_connection
+    if connection is None or connection.closed:
+        connection = init_connection()
+    if reporting_connection is None or reporting_connection.closed:
+        reporting_connection = init_reporting_connection()
+    return connection is not None
+
+def get_reporting_connection():
+    """Connexion des lectures de reporting, repli sur la principale si indisponible"""
+    return reporting_connection if reporting_connection is not None else connection
+
+# Canal de notification écouté par le worker de précalcul (worker.py)
+NOTIFY_CHANNEL = "maj_entretien"
+
+# --- MISES À JOUR DU SCHÉMA ---
+# Chaque mise à jour : (type d'objet, table, nom, ordre DDL). ensure_schema lit
+# d'abord le catalogue et ne joue que les ordres des objets absents : un
+# redémarrage sur un schéma à jour ne prend aucun verrou sur les tables.
+# Les index sont construits CONCURRENTLY (sans bloquer les saisies), sauf sur
+# une table partitionnée où PostgreSQL ne le permet pas.
+SCHEMA_UPGRADES = [
+    # Cube géographique : compteurs précalculés par agglo / commune / quartier
+    ('table', 'cube_geo', 'cube_geo', """CREATE TABLE IF NOT EXISTS cube_geo (
+        niveau varchar(10) NOT NULL,
+        code integer NOT NULL,
+        nb integer NOT NULL DEFAULT 0,
+        PRIMARY KEY (niveau, code)
+    )"""),
+    # Index des filtres de l'écran de consultation (la pagination utilise la clé primaire num)
+    ('index', 'entretien', 'entretien_date_ent_idx', "CREATE INDEX {concurrently} IF NOT EXISTS entretien_date_ent_idx ON entretien (date_ent)"),
+    ('index', 'entretien', 'entretien_commune_idx', "CREATE INDEX {concurrently} IF NOT EXISTS entretien_commune_idx ON entretien (commune)"),
+    # Rattachement normalisé du texte libre commune au référentiel (resolve_communes_history)
+    ('column', 'entretien', 'code_c', "ALTER TABLE entretien ADD COLUMN IF NOT EXISTS code_c integer REFERENCES commune (code_c)"),
+    ('column', 'entretien', 'code_q', "ALTER TABLE entretien ADD COLUMN IF NOT EXISTS code_q integer REFERENCES quartier (code_q)"),
+    ('index', 'entretien', 'entretien_code_c_idx', "CREATE INDEX {concurrently} IF NOT EXISTS entretien_code_c_idx ON entretien (code_c)"),
+    # Copie de la date de l'entretien : clé de partitionnement des tables liées
+    ('column', 'demande', 'date_ent', "ALTER TABLE demande ADD COLUMN IF NOT EXISTS date_ent date"),
+    ('column', 'solution', 'date_ent', "ALTER TABLE solution ADD COLUMN IF NOT EXISTS date_ent date"),
+    # Variables ajoutées en configuration : valeurs en jsonb (ajout de colonne sans réécriture de la table)
+    ('column', 'entretien', 'attributs', "ALTER TABLE entretien ADD COLUMN IF NOT EXISTS attributs jsonb NOT NULL DEFAULT '{}'"),
+    ('index', 'entretien', 'entretien_attributs_idx', "CREATE INDEX {concurrently} IF NOT EXISTS entretien_attributs_idx ON entretien USING GIN (attributs)"),
+    # Horodatage de la dernière écriture (insertion ou modification) : rattrapage de la copie analytique
+    ('column', 'entretien', 'maj', "ALTER TABLE entretien ADD COLUMN IF NOT EXISTS maj timestamptz NOT NULL DEFAULT now()"),
+    ('index', 'entretien', 'entretien_maj_idx', "CREATE INDEX {concurrently} IF NOT EXISTS entretien_maj_idx ON entretien (maj)"),
+    ('function', None, 'entretien_maj', """CREATE OR REPLACE FUNCTION entretien_maj() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN NEW.maj := clock_timestamp(); RETURN NEW; END $$"""),
+    ('trigger', 'entretien', 'entretien_maj_trg',
+     "CREATE TRIGGER entretien_maj_trg BEFORE UPDATE ON entretien FOR EACH ROW EXECUTE FUNCTION entretien_maj()"),
+    # num unique sur toutes les partitions : la clé primaire d'une table partitionnée par
+    # date_ent ne vaut que partition par partition (verrou consultatif contre les insertions concurrentes)
+    ('function', None, 'entretien_num_unique', """CREATE OR REPLACE FUNCTION entretien_num_unique() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND NEW.num = OLD.num THEN RETURN NEW; END IF;
+            PERFORM pg_advisory_xact_lock(hashtext('entretien.num'), NEW.num);
+            IF EXISTS (SELECT 1 FROM entretien WHERE num = NEW.num) THEN
+                RAISE EXCEPTION 'num % déjà utilisé', NEW.num USING ERRCODE = 'unique_violation';
+            END IF;
+            RETURN NEW;
+        END $$"""),
+    ('trigger', 'entretien', 'entretien_num_unique_trg',
+     "CREATE TRIGGER entretien_num_unique_trg BEFORE INSERT OR UPDATE OF num ON entretien "
+     "FOR EACH ROW EXECUTE FUNCTION entretien_num_unique()"),
+    # Valeurs par défaut des colonnes obligatoires de variable (celles des variables d'origine),
+    # sans lesquelles l'ajout d'une variable depuis la configuration échoue
+    ('default', 'variable', 'mois_debut_validite', "ALTER TABLE variable ALTER COLUMN mois_debut_validite SET DEFAULT 1"),
+    ('default', 'variable', 'mois_fin_validite', "ALTER TABLE variable ALTER COLUMN mois_fin_validite SET DEFAULT 12"),
+    ('default', 'variable', 'est_contrainte', "ALTER TABLE variable ALTER COLUMN est_contrainte SET DEFAULT false"),
+]
+# Attente maximale d'un verrou par les ordres DDL : on abandonne (nouvel essai au
+# prochain démarrage) plutôt que de bloquer les saisies derrière une longue lecture
+DDL_LOCK_TIMEOUT = os.getenv("DDL_LOCK_TIMEOUT", "5s")
+
+def read_schema_catalog(cursor):
+    """Tables (et leur type), colonnes, valeurs par défaut, index (valides ou non), fonctions et triggers du schéma courant"""
+    cursor.execute("SELECT c.relname, c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                   "WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p')")
+    tables = dict(cursor.fetchall())
+    cursor.execute("SELECT table_name, column_name, column_default IS NOT NULL FROM information_schema.columns "
+                   "WHERE table_schema = current_schema()")
+    rows = cursor.fetchall()
+    cursor.execute("SELECT c.relname, i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                   "JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = current_schema()")
+    indexes = dict(cursor.fetchall())
+    cursor.execute("SELECT p.proname FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace "
+                   "WHERE n.nspname = current_schema()")
+    functions = {row[0] for row in cursor.fetchall()}
+    cursor.execute("SELECT c.relname, t.tgname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid "
+                   "JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = current_schema() AND NOT t.tgisinternal")
+    return {
+        'table': tables,
+        'column': {(table, col) for table, col, _ in rows},
+        'default': {(table, col) for table, col, has_default in rows if has_default},
+        'index': indexes,
+        'function': functions,
+        'trigger': set(cursor.fetchall()),
+    }
+
+def missing_upgrades(catalog):
+    """Mises à jour de SCHEMA_UPGRADES dont l'objet est absent (un index invalide compte comme absent)"""
+    missing = []
+    for kind, table, name, ddl in SCHEMA_UPGRADES:
+        if kind in ('table', 'function'): present = name in catalog[kind]
+        elif kind == 'index': present = catalog['index'].get(name, False)
+        else: present = (table, name) in catalog[kind]
+        if not present: missing.append((kind, table, name, ddl))
+    return missing
+
+def ensure_schema():
+    if connection is None: return False
+    cursor = connection.cursor()
+    try:
+        catalog = read_schema_catalog(cursor)
+        missing = missing_upgrades(catalog)
+        # Index construits après la transaction, hors table partitionnée
+        concurrent = [u for u in missing if u[0] == 'index' and catalog['table'].get(u[1]) != 'p']
+        if missing: cursor.execute(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'")
+        for upgrade in missing:
+            if upgrade not in concurrent:
+                cursor.execute(upgrade[3].replace("{concurrently} ", ""))
+        connection.commit()
+        if concurrent:
+            connection.autocommit = True
+            try:
+                for _, _, name, ddl in concurrent:
+                    # Reste d'une construction interrompue : index invalide à reconstruire
+                    if name in catalog['index']: cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                    cursor.execute(ddl.replace("{concurrently}", "CONCURRENTLY"))
+            finally:
+                connection.autocommit = False
+        return True
+    except Exception as e:
+        connection.rollback()
+        print("❌ ERREUR MISE À JOUR DU SCHÉMA :", e)
+        return False
+    finally:
+        cursor.close()
+
+# --- PARTITIONNEMENT ANNUEL ---
+# La bascule est explicite (migration_partitions.py) ; ensuite les partitions
+# des années à venir sont créées à l'avance au démarrage.
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = 'entretien'::regclass")
+    return bool(cursor.fetchone()[0])
+
+def ensure_partitions(today=None):
+    """Partitions de l'année en cours et de la suivante ; sans effet si entretien n'est pas partitionné"""
+    if connection is None: return False
+    cursor = connection.cursor()
+    try:
+        if is_partitioned(cursor):
+            for year in partitions.years_ahead(today):
+                start, end = partitions.year_bounds(year)
+                # Partition absente alors que la partition par défaut contient déjà des lignes de l'année
+                cursor.execute(f"SELECT to_regclass(%s) IS NULL AND EXISTS (SELECT 1 FROM {partitions.partition_name(partitions.PARENT)} "
+                               "WHERE date_ent >= %s AND date_ent < %s)",
+                               (partitions.partition_name(partitions.PARENT, year), start, end))
+                before, after = partitions.default_rows_ddl(year) if cursor.fetchone()[0] else ([], [])
+                for ddl in before + partitions.partition_ddl(year) + after:
+                    cursor.execute(ddl)
+        connection.commit()
+        return True
+    except Exception as e:
+        connection.rollback()
+        print("❌ ERREUR PARTITIONS :", e)
+        return False
+    finally:
+        cursor.close()
+
+def migrate_to_partitions():
+    """Bascule entretien / demande / solution en tables partitionnées par année (une seule transaction)"""
+    if connection is None or not ensure_schema(): return False
+    cursor = connection.cursor()
+    try:
+        if is_partitioned(cursor):
+            connection.rollback()
+            return False
+        cursor.execute("SELECT DISTINCT EXTRACT(YEAR FROM date_ent)::int FROM entretien WHERE date_ent IS NOT NULL")
+        years = [row[0] for row in cursor.fetchall()] + partitions.years_ahead()
+        cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE conrelid = 'entretien'::regclass AND contype = 'f'")
+        foreign_keys = cursor.fetchall()
+        for ddl in partitions.migration_ddl(years, foreign_keys):
+            cursor.execute(ddl)
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print("❌ ERREUR MIGRATION PARTITIONS :", e)
+        return False
+    finally:
+        cursor.close()
+    # Index de SCHEMA_UPGRADES recréés sur les tables partitionnées
+    return ensure_schema()
+
+def archive_partition(year):
+    """Détache les partitions d'une année : les tables restent en base, hors des requêtes"""
+    if connection is None: return False
+    cursor = connection.cursor()
+    try:
+        if not is_partitioned(cursor):
+            connection.rollback()
+            return False
+        for ddl in partitions.detach_ddl(year):
+            cursor.execute(ddl)
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print("❌ ERREUR ARCHIVAGE :", e)
+        return False
+    finally:
+        cursor.close()
+    return rebuild_geo_cube()
+
+def list_partitions():
+    """Partitions attachées (table, partition, bornes, lignes estimées)"""
+    columns = ['table', 'partition', 'bornes', 'lignes']
+    if connection is None: return pd.DataFrame(columns=columns)
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT p.relname, c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint "
+                       "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                       "WHERE p.relname = ANY(%s) ORDER BY 1, 2", (list(partitions.TABLES),))
+        return pd.DataFrame(cursor.fetchall(), columns=columns)
+    except Exception:
+        connection.rollback()
+        return pd.DataFrame(columns=columns)
+    finally:
+        cursor.close()
+
+# =================================================================
+#  REQUÊTES PRÉPARÉES (CÔTÉ SERVEUR)
+# =================================================================
+# Les requêtes les plus fréquentes sont analysées et planifiées une seule
+# fois par connexion (PREPARE), puis exécutées par leur nom (EXECUTE).
+
+ENTRETIEN_COLUMNS = ['mode', 'duree', 'sexe', 'age', 'vient_pr', 'sit_fam', 'enfant', 'modele_fam',
+                     'profession', 'ress', 'origine', 'commune', 'partenaire']
+# Codes géographiques calculés à partir de la commune saisie
+GEO_COLUMNS = ['code_c', 'code_q']
+# Toute autre variable du questionnaire est stockée dans entretien.attributs (jsonb)
+ATTRIBUTES_COLUMN = 'attributs'
+# Horodatage technique de la dernière écriture (trigger), absent des données restituées
+CHANGE_COLUMN = 'maj'
+ENTRETIEN_KEYS = frozenset(['num', 'date_ent'] + ENTRETIEN_COLUMNS + GEO_COLUMNS + [ATTRIBUTES_COLUMN, CHANGE_COLUMN])
+
+PREPARED_STATEMENTS = {
+    # Séquence (deux saisies simultanées n'obtiennent jamais le même num), recalée sur
+    # MAX(num) si des entretiens ont été importés avec leur numéro
+    'next_num_entretien': ("SELECT CASE WHEN n >= m THEN n ELSE setval('entretien_num_seq', m) END FROM "
+                           "(SELECT nextval('entretien_num_seq') AS n, (SELECT COALESCE(MAX(num), 0) + 1 FROM entretien) AS m) t"),
+    'insert_entretien': (
+        "INSERT INTO entretien (num, date_ent, " + ", ".join(ENTRETIEN_COLUMNS + GEO_COLUMNS + [ATTRIBUTES_COLUMN]) + ") "
+        "VALUES (" + ", ".join(f"${i}" for i in range(1, len(ENTRETIEN_COLUMNS + GEO_COLUMNS) + 4)) + ") "
+        "RETURNING num"),
+    # date_ent recopiée depuis l'entretien : elle désigne la partition (même année que l'entretien) ;
+    # num est unique sur toutes les partitions (trigger entretien_num_unique), la sous-requête renvoie une ligne au plus
+    'insert_demande': ("INSERT INTO demande (num, pos, nature, date_ent) "
+                       "VALUES ($1, $2, $3, (SELECT date_ent FROM entretien WHERE num = $1))"),
+    'insert_solution': ("INSERT INTO solution (num, pos, nature, date_ent) "
+                        "VALUES ($1, $2, $3, (SELECT date_ent FROM entretien WHERE num = $1))"),
+    'modalites_variable': "SELECT code, lib_m FROM modalite WHERE tab = $1 AND pos = $2 ORDER BY pos_m",
+    'plage_variable': "SELECT val_min, val_max FROM plage WHERE tab = $1 AND pos = $2",
+    'valeurs_variable': "SELECT lib FROM valeurs_c WHERE tab = $1 AND pos = $2 ORDER BY pos_c",
+    'increment_cube_geo': ("INSERT INTO cube_geo (niveau, code, nb) VALUES ($1, $2, 1) "
+                           "ON CONFLICT (niveau, code) DO UPDATE SET nb = cube_geo.nb + 1"),
+}
+
+# (id connexion, pid serveur) -> noms des requêtes déjà préparées sur cette session
+_prepared_registry = {}
+
+def _prepare(conn, cursor, name):
+    key = (id(conn), conn.get_backend_pid())
+    prepared = _prepared_registry.setdefault(key, set())
+    if name not in prepared:
+        # PREPARE n'est pas transactionnel : la requête survit à un ROLLBACK
+        cursor.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+        prepared.add(name)
+
+def _execute_sql(name, nb_params):
+    if not nb_params: return f"EXECUTE {name}"
+    return f"EXECUTE {name} (" + ", ".join(["%s"] * nb_params) + ")"
+
+def execute_prepared(conn, cursor, name, params=()):
+    _prepare(conn, cursor, name)
+    cursor.execute(_execute_sql(name, len(params)), params)
+
+def execute_prepared_batch(conn, cursor, name, rows):
+    """Exécute une requête préparée sur plusieurs lignes en un seul aller-retour"""
+    if not rows: return
+    _prepare(conn, cursor, name)
+    execute_batch(cursor, _execute_sql(name, len(rows[0])), rows, page_size=100)
 
 # =================================================================
 #  FONCTIONS SQL (LOGIQUE MÉTIER)
 # =================================================================
 
+# Position de la variable dans sa rubrique : à la suite des variables déjà rangées
+SQL_NEXT_POS_R = "(SELECT COALESCE(MAX(pos_r), 0) + 1 FROM variable WHERE tab = 'ENTRETIEN' AND rubrique = %s)"
+
+def assign_modalite_codes(existing, labels):
+    """
+    Codes des modalités enregistrées : un libellé déjà connu garde son code (les
+    entretiens saisis stockent le code), un nouveau libellé prend le code numérique
+    suivant le plus grand déjà attribué. existing : {lib_m: code}.
+    """
+    next_code = max([int(code) for code in existing.values() if str(code).isdigit()], default=0) + 1
+    codes = []
+    for txt in labels:
+        if txt in existing:
+            codes.append(str(existing[txt]))
+        else:
+            codes.append(str(next_code))
+            next_code += 1
+    return codes
+
 def save_configuration(context, is_new_var, var_pos, var_lib, var_type, rub_id, comment, modalites):
     if connection is None: return False
     cursor = connection.cursor()
     try:
         if context == 'ENTRETIEN':
             if not is_new_var:
-                cursor.execute("UPDATE variable SET lib=%s, type_v=%s, rubrique=%s, commentaire=%s WHERE pos=%s AND tab='ENTRETIEN'", 
-                             (var_lib, var_type, rub_id, comment, var_pos))
+                # Changement de rubrique : la variable passe en fin de la nouvelle rubrique
+                cursor.execute("UPDATE variable SET lib=%s, type_v=%s, rubrique=%s, commentaire=%s, "
+                               f"pos_r = CASE WHEN rubrique = %s THEN pos_r ELSE {SQL_NEXT_POS_R} END "
+                               "WHERE pos=%s AND tab='ENTRETIEN'",
+                             (var_lib, var_type, rub_id, comment, rub_id, rub_id, var_pos))
             else:
-                cursor.execute("INSERT INTO variable (tab, pos, lib, type_v, rubrique, commentaire) VALUES ('ENTRETIEN', %s, %s, %s, %s, %s)", 
-                             (var_pos, var_lib, var_type, rub_id, comment))
+                cursor.execute("INSERT INTO variable (tab, pos, pos_r, lib, type_v, rubrique, commentaire) "
+                               f"VALUES ('ENTRETIEN', %s, {SQL_NEXT_POS_R}, %s, %s, %s, %s)",
+                             (var_pos, rub_id, var_lib, var_type, rub_id, comment))
 
         if var_type == 'MOD':
+            # Codes existants lus avant la suppression : ils restent attachés à leur libellé
+            cursor.execute("SELECT lib_m, code FROM modalite WHERE tab=%s AND pos=%s", (context, var_pos))
+            existing = dict(cursor.fetchall())
             cursor.execute("DELETE FROM modalite WHERE tab=%s AND pos=%s", (context, var_pos))
             if modalites:
                 values = []
-                for idx, txt in enumerate(modalites):
-                    code = txt[:15].upper().replace(" ", "_")
+                for idx, (txt, code) in enumerate(zip(modalites, assign_modalite_codes(existing, modalites))):
                     values.append((context, var_pos, idx+1, txt, code))
                 cursor.executemany("INSERT INTO modalite (tab, pos, pos_m, lib_m, code) VALUES (%s, %s, %s, %s, %s)", values)
 
+        cursor.execute(f"NOTIFY {NOTIFY_CHANNEL}")
         connection.commit()
+        _validation_cache['rules'] = None
         return True
     except Exception:
         connection.rollback()
@@ -80,14 +435,14 @@ def get_questionnaire_structure():
             var_data = {'pos': var['pos'], 'lib': var['lib'], 'type': var['type_v'], 'comment': var['commentaire'], 'options': {}}
             
             if var['type_v'] == 'MOD':
-                cursor.execute("SELECT code, lib_m FROM modalite WHERE tab = %s AND pos = %s ORDER BY pos_m", ('ENTRETIEN', var['pos']))
+                execute_prepared(connection, cursor, 'modalites_variable', ('ENTRETIEN', var['pos']))
                 var_data['options'] = {row['lib_m']: row['code'] for row in cursor.fetchall()}
             elif var['type_v'] == 'NUM':
-                cursor.execute("SELECT val_min, val_max FROM plage WHERE tab = %s AND pos = %s", ('ENTRETIEN', var['pos']))
+                execute_prepared(connection, cursor, 'plage_variable', ('ENTRETIEN', var['pos']))
                 plage = cursor.fetchone()
                 if plage: var_data['options'] = {'min': plage['val_min'], 'max': plage['val_max']}
             elif var['type_v'] == 'CHAINE':
-                cursor.execute("SELECT lib FROM valeurs_c WHERE tab = %s AND pos = %s ORDER BY pos_c", ('ENTRETIEN', var['pos']))
+                execute_prepared(connection, cursor, 'valeurs_variable', ('ENTRETIEN', var['pos']))
                 var_data['options'] = [row['lib'] for row in cursor.fetchall()]
             
             structure[rubrique_lib].append(var_data)
@@ -99,49 +454,53 @@ def get_demande_solution_modalites():
     if not connection: return {}, {}
     cursor = connection.cursor(cursor_factory=RealDictCursor)
     try:
-        cursor.execute("SELECT code, lib_m FROM modalite WHERE tab = %s AND pos = 3 ORDER BY pos_m", ('DEMANDE',))
+        execute_prepared(connection, cursor, 'modalites_variable', ('DEMANDE', 3))
         demande_modalites = {row['lib_m']: row['code'] for row in cursor.fetchall()}
-        cursor.execute("SELECT code, lib_m FROM modalite WHERE tab = %s AND pos = 3 ORDER BY pos_m", ('SOLUTION',))
+        execute_prepared(connection, cursor, 'modalites_variable', ('SOLUTION', 3))
         solution_modalites = {row['lib_m']: row['code'] for row in cursor.fetchall()}
         return demande_modalites, solution_modalites
     finally:
         cursor.close()
 
+def split_attributes(data):
+    """Réponses aux variables sans colonne dans entretien (ajoutées en configuration), champs vides exclus"""
+    return {key: value for key, value in data.items()
+            if key not in ENTRETIEN_KEYS and value is not None and value != ''}
+
 def insert_full_entretien(data):
     if not connection: return None
     cursor = connection.cursor()
     try:
+        # ÉTAPE 0 : Contrôle par les règles du questionnaire, rien n'est écrit en cas de violation bloquante
+        violations = blocking_violations(pd.DataFrame([data]), get_cached_validation_rules(connection))
+        if not violations.empty:
+            connection.rollback()
+            print("❌ ENTRETIEN REFUSÉ :", violations[['colonne', 'valeur', 'regle']].to_dict('records'))
+            return None
+
         # ÉTAPE 1 : On calcule nous-mêmes le prochain ID libre
-        # On demande le MAX actuel et on ajoute 1
-        cursor.execute("SELECT COALESCE(MAX(num), 0) + 1 FROM entretien")
+        # Séquence recalée sur le MAX actuel + 1 si elle est en retard
+        execute_prepared(connection, cursor, 'next_num_entretien')
         next_id = cursor.fetchone()[0]
         
         print(f"🔧 FORÇAGE ID : Le nouvel ID sera {next_id}")
 
+        # Rattachement de la commune saisie au référentiel (codes stockés avec l'entretien)
+        ref = get_geo_reference()
+        code_c, code_q = geo.resolve_commune(data.get('commune'), ref)
+
         # ÉTAPE 2 : On insère en FORÇANT ce numéro (ajout de la colonne 'num')
-        cursor.execute("""
-            INSERT INTO entretien (num, date_ent, mode, duree, sexe, age, vient_pr, sit_fam, enfant, modele_fam, profession, ress, origine, commune, partenaire)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING num
-        """, (
-            next_id,          # <--- On met notre ID calculé ici
-            date.today(), 
-            data.get('mode'), 
-            data.get('duree'), 
-            data.get('sexe'), 
-            data.get('age'), 
-            data.get('vient_pr'), 
-            data.get('sit_fam'), 
-            data.get('enfant'), 
-            data.get('modele_fam'), 
-            data.get('profession'), 
-            data.get('ress'), 
-            data.get('origine'), 
-            data.get('commune'), 
-            data.get('partenaire')
-        ))
+        attributs = Json(split_attributes(data), dumps=lambda obj: json.dumps(obj, default=str))
+        execute_prepared(connection, cursor, 'insert_entretien',
+                         [next_id, date.today()] + [data.get(col) for col in ENTRETIEN_COLUMNS] + [code_c, code_q, attributs])
         
         # On récupère le résultat pour être sûr
         new_num = cursor.fetchone()[0]
+
+        # ÉTAPE 3 : Mise à jour du cube géographique dans la même transaction
+        _increment_geo_cube(cursor, code_c, code_q, ref)
+        # Prévient le worker de précalcul (délivré seulement si la transaction est validée)
+        cursor.execute(f"NOTIFY {NOTIFY_CHANNEL}")
         connection.commit()
         return new_num
 
@@ -156,7 +515,7 @@ def insert_demandes(num, codes):
     if not codes or not connection: return
     cursor = connection.cursor()
     try:
-        cursor.executemany("INSERT INTO demande (num, pos, nature) VALUES (%s,%s,%s)", [(num, i+1, c) for i,c in enumerate(codes)])
+        execute_prepared_batch(connection, cursor, 'insert_demande', [(num, i+1, c) for i,c in enumerate(codes)])
         connection.commit()
     finally: cursor.close()
 
@@ -164,7 +523,7 @@ def insert_solutions(num, codes):
     if not codes or not connection: return
     cursor = connection.cursor()
     try:
-        cursor.executemany("INSERT INTO solution (num, pos, nature) VALUES (%s,%s,%s)", [(num, i+1, c) for i,c in enumerate(codes)])
+        execute_prepared_batch(connection, cursor, 'insert_solution', [(num, i+1, c) for i,c in enumerate(codes)])
         connection.commit()
     finally: cursor.close()
 
@@ -190,44 +549,389 @@ def add_variable_sql(libelle, type_v, rubrique_id, position, commentaire):
     if not connection: return False
     cursor = connection.cursor()
     try:
-        cursor.execute("INSERT INTO variable (tab, pos, lib, type_v, rubrique, commentaire) VALUES ('ENTRETIEN', %s, %s, %s, %s, %s)", 
-                      (position, libelle, type_v, rubrique_id, commentaire))
+        cursor.execute("INSERT INTO variable (tab, pos, pos_r, lib, type_v, rubrique, commentaire) "
+                       f"VALUES ('ENTRETIEN', %s, {SQL_NEXT_POS_R}, %s, %s, %s, %s)",
+                      (position, rubrique_id, libelle, type_v, rubrique_id, commentaire))
         connection.commit()
+        _validation_cache['rules'] = None
         return True
     except Exception:
         connection.rollback()
         return False
 
+def get_decoding_maps(cursor):
+    """Correspondances colonne -> position, (position, code) -> libellé et types déclarés"""
+    cursor.execute("""SELECT v.pos, v.lib, v.type_v, p.val_min, p.val_max FROM variable v
+                      LEFT JOIN plage p ON p.tab = v.tab AND p.pos = v.pos WHERE v.tab='ENTRETIEN'""")
+    variables = cursor.fetchall()
+    vars_map = {row['lib'].lower(): row['pos'] for row in variables}
+    var_types = {row['lib'].lower(): {'type': row.get('type_v'), 'min': row.get('val_min'), 'max': row.get('val_max')}
+                 for row in variables}
+    
+    cursor.execute("SELECT pos, code, lib_m FROM modalite WHERE tab='ENTRETIEN'")
+    modalites = cursor.fetchall()
+    
+    decodage_map = {}
+    for row in modalites:
+        pos = row['pos']
+        code = row['code']
+        lib = row['lib_m']
+        if pos not in decodage_map: decodage_map[pos] = {}
+        decodage_map[pos][str(code)] = lib
+    return vars_map, decodage_map, var_types
+
+def expand_attributes(df, var_types):
+    """
+    Aplatit entretien.attributs : une colonne par variable déclarée sans colonne
+    physique, numérique pour les NUM, texte (code ou libre) sinon.
+    var_types : {lib: {'type': type_v, ...}} (get_decoding_maps ou règles de validation).
+    La colonne technique maj est retirée au passage.
+    """
+    if CHANGE_COLUMN in df.columns: df = df.drop(columns=[CHANGE_COLUMN])
+    if ATTRIBUTES_COLUMN not in df.columns: return df
+    attrs = pd.DataFrame([a or {} for a in df[ATTRIBUTES_COLUMN]], index=df.index)
+    for col, meta in var_types.items():
+        if col in ENTRETIEN_KEYS or col in df.columns: continue
+        values = attrs[col] if col in attrs.columns else pd.Series(None, index=df.index, dtype=object)
+        if meta.get('type') == 'NUM':
+            values = pd.to_numeric(values, errors='coerce')
+        else:
+            values = values.map(lambda v: None if v is None or v != v else str(v))
+        df[col] = values
+    return df.drop(columns=[ATTRIBUTES_COLUMN])
+
+def decode_entretiens(df, vars_map, decodage_map):
+    """Remplace les codes des variables MOD par leur libellé"""
+    for col_name in df.columns:
+        if col_name in vars_map:
+            pos_var = vars_map[col_name]
+            if pos_var in decodage_map:
+                df[col_name] = df[col_name].astype(str).map(decodage_map[pos_var]).fillna(df[col_name].astype(str))
+    return df
+
 def get_data_for_reporting():
-    if not connection: return pd.DataFrame()
-    cursor = connection.cursor(cursor_factory=RealDictCursor)
+    conn = get_reporting_connection()
+    if not conn: return pd.DataFrame()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
     try:
         cursor.execute("SELECT * FROM entretien")
         data = cursor.fetchall()
         df = pd.DataFrame(data)
         if df.empty: return df
 
-        cursor.execute("SELECT pos, lib FROM variable WHERE tab='ENTRETIEN'")
-        vars_map = {row['lib'].lower(): row['pos'] for row in cursor.fetchall()}
-        
-        cursor.execute("SELECT pos, code, lib_m FROM modalite WHERE tab='ENTRETIEN'")
-        modalites = cursor.fetchall()
-        
-        decodage_map = {}
-        for row in modalites:
-            pos = row['pos']
-            code = row['code']
-            lib = row['lib_m']
-            if pos not in decodage_map: decodage_map[pos] = {}
-            decodage_map[pos][str(code)] = lib
-
-        for col_name in df.columns:
-            if col_name in vars_map:
-                pos_var = vars_map[col_name]
-                if pos_var in decodage_map:
-                    df[col_name] = df[col_name].astype(str).map(decodage_map[pos_var]).fillna(df[col_name].astype(str))
-        return df
+        vars_map, decodage_map, var_types = get_decoding_maps(cursor)
+        df = decode_entretiens(expand_attributes(df, var_types), vars_map, decodage_map)
+        # Types compacts déduits des métadonnées (catégories, entiers bornés, dates)
+        return dtype_plan.optimize_frame(df, var_types)
     except Exception:
         return pd.DataFrame()
     finally:
-        cursor.close()
\ No newline at end of file
+        cursor.close()
+
+# =================================================================
+#  CONSULTATION PAGINÉE (KEYSET SUR entretien.num)
+# =================================================================
+
+# Filtres autorisés : uniquement des colonnes indexées
+BROWSE_FILTERS = {
+    'date_debut': "date_ent >= %s",
+    'date_fin': "date_ent <= %s",
+    'commune': "commune = %s",
+}
+
+def get_entretiens_page(after=None, before=None, limit=50, descending=False, filters=None):
+    """
+    Une page d'entretiens décodés. La position est donnée par le dernier num
+    vu (after, page suivante) ou le premier (before, page précédente) :
+    le coût est le même en page 1 et en page 10 000, contrairement à OFFSET.
+    """
+    # error : lecture impossible (à distinguer d'une page vide)
+    page = {'rows': pd.DataFrame(), 'first': None, 'last': None, 'has_next': False, 'has_prev': False, 'error': True}
+    conn = get_reporting_connection()
+    if not conn: return page
+
+    where, params = [], []
+    for key, clause in BROWSE_FILTERS.items():
+        value = (filters or {}).get(key)
+        if value not in (None, ''):
+            where.append(clause)
+            params.append(value)
+
+    # En reculant, on lit dans l'ordre inverse puis on retourne la page
+    backward = before is not None
+    cmp = '>' if descending == backward else '<'
+    if backward or after is not None:
+        where.append(f"num {cmp} %s")
+        params.append(before if backward else after)
+
+    sql = "SELECT * FROM entretien"
+    if where: sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY num {'ASC' if cmp == '>' else 'DESC'} LIMIT %s"
+    params.append(limit + 1)
+
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        page['error'] = False
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backward: rows.reverse()
+        if not rows: return page
+
+        vars_map, decodage_map, var_types = get_decoding_maps(cursor)
+        page['rows'] = decode_entretiens(expand_attributes(pd.DataFrame(rows), var_types), vars_map, decodage_map)
+        page['first'], page['last'] = rows[0]['num'], rows[-1]['num']
+        page['has_next'] = True if backward else has_more
+        page['has_prev'] = has_more if backward else after is not None
+        return page
+    except Exception:
+        conn.rollback()
+        page['rows'], page['error'] = pd.DataFrame(), True
+        return page
+    finally:
+        cursor.close()
+
+# =================================================================
+#  CONTRÔLE QUALITÉ DES DONNÉES
+# =================================================================
+
+# Variables à renseigner obligatoirement (libellés, séparés par des virgules) : le
+# questionnaire ne porte pas cette information (est_contrainte = type de liste)
+REQUIRED_FIELDS = [lib.strip() for lib in os.getenv("CHAMPS_OBLIGATOIRES", "").split(",") if lib.strip()]
+# Règles relues au plus toutes les VALIDATION_RULES_TTL secondes par l'enregistrement
+VALIDATION_RULES_TTL = 60
+_validation_cache = {'at': 0.0, 'rules': None}
+
+def get_validation_rules(cursor):
+    """Règles compilées depuis variable / modalite / plage / valeurs_c"""
+    cursor.execute("SELECT pos, lib, type_v FROM variable WHERE tab='ENTRETIEN'")
+    variables = cursor.fetchall()
+    cursor.execute("SELECT pos, code FROM modalite WHERE tab='ENTRETIEN'")
+    modalites = cursor.fetchall()
+    cursor.execute("SELECT pos, val_min, val_max FROM plage WHERE tab='ENTRETIEN'")
+    plages = cursor.fetchall()
+    cursor.execute("SELECT pos, lib FROM valeurs_c WHERE tab='ENTRETIEN'")
+    valeurs_c = cursor.fetchall()
+    return validation.compile_rules(variables, modalites, plages, valeurs_c, REQUIRED_FIELDS)
+
+def get_cached_validation_rules(conn):
+    if _validation_cache['rules'] is None or time.monotonic() - _validation_cache['at'] > VALIDATION_RULES_TTL:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            _validation_cache['rules'] = get_validation_rules(cursor)
+            _validation_cache['at'] = time.monotonic()
+        finally:
+            cursor.close()
+    return _validation_cache['rules']
+
+def blocking_violations(df, rules):
+    violations = validation.validate_frame(df, rules)
+    return violations[violations['regle'].isin(validation.REGLES_BLOQUANTES)]
+
+def check_entretien(data):
+    """Violations bloquantes d'un entretien saisi (vide si enregistrable) ; None si les règles sont illisibles"""
+    if not connection: return None
+    try:
+        return blocking_violations(pd.DataFrame([data]), get_cached_validation_rules(connection))
+    except Exception:
+        connection.rollback()
+        return None
+
+def validate_entretiens(df):
+    """Contrôle d'un lot à importer (codes bruts) ; None si les règles sont illisibles"""
+    conn = get_reporting_connection()
+    if not conn: return None
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        return validation.validate_frame(df, get_validation_rules(cursor))
+    except Exception:
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+
+def audit_entretiens():
+    """Contrôle de toute la table entretien en une passe ; None en cas d'erreur"""
+    conn = get_reporting_connection()
+    if not conn: return None
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        rules = get_validation_rules(cursor)
+        cursor.execute("SELECT * FROM entretien")
+        return validation.validate_frame(expand_attributes(pd.DataFrame(cursor.fetchall()), rules), rules)
+    except Exception:
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+
+# =================================================================
+#  AUTOCOMPLÉTION DES CHAMPS CHAINE
+# =================================================================
+
+# Index reconstruits seulement quand la configuration (valeurs_c) change ; la
+# version elle-même n'est relue qu'une fois par AUTOCOMPLETE_TTL secondes
+AUTOCOMPLETE_TTL = 30
+_autocomplete_cache = {'version': None, 'indexes': {}, 'checked': 0.0}
+
+def get_configuration_version(cursor):
+    """Empreinte des listes de valeurs : change dès qu'une liste est modifiée"""
+    cursor.execute("SELECT md5(COALESCE(string_agg(tab || ':' || pos || ':' || pos_c || ':' || lib, '|' ORDER BY tab, pos, pos_c), '')) AS version FROM valeurs_c")
+    return cursor.fetchone()['version']
+
+def get_autocomplete_indexes():
+    """{lib variable CHAINE: index trié} sur valeurs_c + valeurs déjà saisies"""
+    if _autocomplete_cache['version'] is not None and time.monotonic() - _autocomplete_cache['checked'] < AUTOCOMPLETE_TTL:
+        return _autocomplete_cache['indexes']
+    # Connexion principale (requêtes courtes) : la page de saisie ne doit jamais attendre
+    # derrière une longue lecture des tableaux de bord sur la connexion de reporting
+    conn = connection
+    if not conn: return {}
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        version = get_configuration_version(cursor)
+        _autocomplete_cache['checked'] = time.monotonic()
+        if version == _autocomplete_cache['version']:
+            return _autocomplete_cache['indexes']
+
+        cursor.execute("""SELECT v.lib, c.lib AS valeur FROM variable v
+                          LEFT JOIN valeurs_c c ON c.tab = v.tab AND c.pos = v.pos
+                          WHERE v.tab = 'ENTRETIEN' AND v.type_v = 'CHAINE' ORDER BY v.pos, c.pos_c""")
+        values = {}
+        for row in cursor.fetchall():
+            values.setdefault(row['lib'].lower(), [])
+            if row['valeur']: values[row['lib'].lower()].append(row['valeur'])
+
+        for col in values:
+            if col in ENTRETIEN_COLUMNS:
+                cursor.execute(f"SELECT DISTINCT {col} AS valeur FROM entretien WHERE {col} IS NOT NULL")
+            elif col not in ENTRETIEN_KEYS:
+                # Variable ajoutée en configuration : réponses dans attributs (opérateur ? servi par l'index GIN)
+                cursor.execute("SELECT DISTINCT attributs->>%s AS valeur FROM entretien WHERE attributs ? %s", (col, col))
+            else:
+                continue
+            values[col] += [row['valeur'] for row in cursor.fetchall()]
+
+        indexes = {col: autocomplete.build_index(vals) for col, vals in values.items()}
+        _autocomplete_cache.update(version=version, indexes=indexes)
+        return indexes
+    except Exception:
+        conn.rollback()
+        return _autocomplete_cache['indexes']
+    finally:
+        cursor.close()
+
+# =================================================================
+#  CUBE GÉOGRAPHIQUE (AGGLO -> COMMUNE -> QUARTIER)
+# =================================================================
+
+# Référentiel chargé une seule fois (les tables géographiques bougent peu)
+_geo_reference = None
+
+GEO_ROLLUP_SQL = {
+    geo.NIVEAU_AGGLO: ("SELECT g.code, COALESCE(a.nom_a, %s) AS lib, g.nb FROM cube_geo g "
+                       "LEFT JOIN agglo a ON a.code_a = g.code WHERE g.niveau = 'AGGLO'", None),
+    geo.NIVEAU_COMMUNE: ("SELECT g.code, COALESCE(c.nom_c, %s) AS lib, g.nb FROM cube_geo g "
+                         "LEFT JOIN commune c ON c.code_c = g.code WHERE g.niveau = 'COMMUNE'",
+                         "COALESCE(c.code_a, 0) = %s"),
+    geo.NIVEAU_QUARTIER: ("SELECT g.code, COALESCE(q.nom_q, %s) AS lib, g.nb FROM cube_geo g "
+                          "LEFT JOIN quartier q ON q.code_q = g.code WHERE g.niveau = 'QUARTIER'",
+                          "q.code_c = %s"),
+}
+
+def get_geo_reference():
+    global _geo_reference
+    if _geo_reference is not None: return _geo_reference
+    if not connection: return geo.build_geo_reference([], [], [])
+    cursor = connection.cursor(cursor_factory=RealDictCursor)
+    try:
+        cursor.execute("SELECT code_a, nom_a FROM agglo")
+        agglos = cursor.fetchall()
+        cursor.execute("SELECT code_c, nom_c, code_a FROM commune")
+        communes = cursor.fetchall()
+        cursor.execute("SELECT code_q, nom_q, code_c FROM quartier")
+        quartiers = cursor.fetchall()
+        _geo_reference = geo.build_geo_reference(agglos, communes, quartiers)
+        return _geo_reference
+    finally:
+        cursor.close()
+
+def reset_geo_reference():
+    global _geo_reference
+    _geo_reference = None
+
+def _increment_geo_cube(cursor, code_c, code_q, ref):
+    execute_prepared_batch(connection, cursor, 'increment_cube_geo', geo.cube_keys(code_c, code_q, ref))
+
+def resolve_communes_history():
+    """
+    Rattache tout l'historique : chaque texte commune distinct est résolu une
+    seule fois, puis une mise à jour par texte (index entretien_commune_idx).
+    Renvoie {texte: nb} des textes restés sans rattachement, None en cas d'erreur.
+    """
+    if not connection: return None
+    cursor = connection.cursor()
+    try:
+        ref = get_geo_reference()
+        cursor.execute("SELECT commune, COUNT(*) FROM entretien WHERE commune IS NOT NULL GROUP BY commune")
+        counts_by_text = dict(cursor.fetchall())
+        resolved = geo.resolve_many(counts_by_text, ref)
+
+        execute_batch(cursor,
+                      "UPDATE entretien SET code_c = %s, code_q = %s WHERE commune = %s "
+                      "AND (code_c, code_q) IS DISTINCT FROM (%s, %s)",
+                      [(c, q, text, c, q) for text, (c, q) in resolved.items()], page_size=100)
+        connection.commit()
+        return {text: counts_by_text[text] for text, (c, _) in resolved.items() if c is None}
+    except Exception as e:
+        connection.rollback()
+        print("❌ ERREUR RATTACHEMENT COMMUNES :", e)
+        return None
+    finally:
+        cursor.close()
+
+def rebuild_geo_cube():
+    """Recalcule tout le cube (démarrage, changement de référentiel)"""
+    if not connection: return False
+    ref = get_geo_reference()
+    cursor = connection.cursor()
+    try:
+        # Verrou pris avant le comptage : les saisies en cours (increment_cube_geo) sont validées
+        # avant lui et comptées dans l'agrégat ; les suivantes attendent et incrémentent le nouveau cube
+        cursor.execute("LOCK TABLE cube_geo IN EXCLUSIVE MODE")
+        # Agrégat sur les codes stockés (resolve_communes_history) plutôt que sur le texte libre
+        cursor.execute("SELECT code_c, code_q, COUNT(*) FROM entretien GROUP BY code_c, code_q")
+        cube = geo.rollup_counts({(row[0], row[1]): row[2] for row in cursor.fetchall()}, ref)
+
+        cursor.execute("DELETE FROM cube_geo")
+        cursor.executemany("INSERT INTO cube_geo (niveau, code, nb) VALUES (%s, %s, %s)",
+                           [(niveau, code, nb) for (niveau, code), nb in cube.items()])
+        connection.commit()
+        return True
+    except Exception:
+        connection.rollback()
+        return False
+    finally:
+        cursor.close()
+
+def get_geo_rollup(niveau, parent_code=None):
+    """Compteurs précalculés d'un niveau, filtrés éventuellement sur le parent"""
+    conn = get_reporting_connection()
+    if not conn or niveau not in GEO_ROLLUP_SQL: return pd.DataFrame(columns=['code', 'lib', 'nb'])
+    query, parent_filter = GEO_ROLLUP_SQL[niveau]
+    params = [geo.LIB_NON_LOCALISE]
+    if parent_code is not None and parent_filter:
+        query += " AND " + parent_filter
+        params.append(parent_code)
+    query += " ORDER BY g.nb DESC"
+
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cursor.execute(query, params)
+        return pd.DataFrame(cursor.fetchall(), columns=['code', 'lib', 'nb'])
+    except Exception:
+        conn.rollback()
+        return pd.DataFrame(columns=['code', 'lib', 'nb'])
+    finally:
+        cursor.close()
@@ -0,0 +1,108 @@
+"""
+Benchmark des requêtes "chaudes" du backend : requêtes classiques
+(analyse + planification à chaque appel, executemany = un aller-retour par
+ligne) contre requêtes préparées côté serveur + envoi groupé.
+
+Usage (base de test conseillée, tout est annulé par ROLLBACK) :
+    python bench_requetes.py [nb_iterations]
+"""
+import sys
+import time
+import statistics
+from datetime import date
+
+import backend
+
+# Requêtes telles qu'exécutées avant la mise en place des requêtes préparées
+SQL_MODALITES = "SELECT code, lib_m FROM modalite WHERE tab = %s AND pos = %s ORDER BY pos_m"
+SQL_NEXT_NUM = "SELECT COALESCE(MAX(num), 0) + 1 FROM entretien"
+SQL_INSERT_ENTRETIEN = (
+    "INSERT INTO entretien (num, date_ent, " + ", ".join(backend.ENTRETIEN_COLUMNS) + ") "
+    "VALUES (" + ", ".join(["%s"] * (len(backend.ENTRETIEN_COLUMNS) + 2)) + ") RETURNING num")
+SQL_INSERT_DEMANDE = ("INSERT INTO demande (num, pos, nature, date_ent) "
+                      "VALUES (%(num)s, %(pos)s, %(nature)s, (SELECT date_ent FROM entretien WHERE num = %(num)s))")
+
+ENTRETIEN_TYPE = {'mode': 1, 'duree': 2, 'sexe': 1, 'age': 3, 'vient_pr': 1, 'sit_fam': '2', 'enfant': 0,
+                  'modele_fam': None, 'profession': 3, 'ress': 2, 'origine': '1', 'commune': 'Vannes',
+                  'partenaire': None}
+
+
+def _timed(func, iterations):
+    durations = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def _scenario_classique(conn, cursor, codes_demande):
+    def lookup(i):
+        cursor.execute(SQL_MODALITES, ('ENTRETIEN', 3 + i % 10))
+        cursor.fetchall()
+
+    def insert(i):
+        cursor.execute(SQL_NEXT_NUM)
+        num = cursor.fetchone()[0]
+        cursor.execute(SQL_INSERT_ENTRETIEN, [num, date.today()] + [ENTRETIEN_TYPE[c] for c in backend.ENTRETIEN_COLUMNS])
+        cursor.fetchone()
+        cursor.executemany(SQL_INSERT_DEMANDE, [{'num': num, 'pos': p + 1, 'nature': c} for p, c in enumerate(codes_demande)])
+
+    return lookup, insert
+
+
+def _scenario_prepare(conn, cursor, codes_demande):
+    def lookup(i):
+        backend.execute_prepared(conn, cursor, 'modalites_variable', ('ENTRETIEN', 3 + i % 10))
+        cursor.fetchall()
+
+    def insert(i):
+        backend.execute_prepared(conn, cursor, 'next_num_entretien')
+        num = cursor.fetchone()[0]
+        backend.execute_prepared(conn, cursor, 'insert_entretien',
+                                 [num, date.today()] + [ENTRETIEN_TYPE[c] for c in backend.ENTRETIEN_COLUMNS]
+                                 + [None] * len(backend.GEO_COLUMNS) + ['{}'])
+        cursor.fetchone()
+        backend.execute_prepared_batch(conn, cursor, 'insert_demande', [(num, p + 1, c) for p, c in enumerate(codes_demande)])
+
+    return lookup, insert
+
+
+def _report(label, durations):
+    durations = sorted(durations)
+    p95 = durations[int(len(durations) * 0.95) - 1]
+    print(f"  {label:<32} moy {statistics.mean(durations):7.3f} ms | p50 {statistics.median(durations):7.3f} ms | p95 {p95:7.3f} ms")
+    return statistics.mean(durations)
+
+
+def main(iterations=500):
+    # Schéma à jour (colonnes ajoutées par ensure_schema), comme au démarrage de l'application
+    backend.ensure_schema()
+    results = {}
+    for label, scenario in (("classique", _scenario_classique), ("préparé", _scenario_prepare)):
+        # Connexion neuve à chaque scénario : même point de départ (cache de plans vide)
+        conn = backend.init_connection()
+        if conn is None:
+            print("❌ Connexion impossible (voir PG_HOST / PG_PASSWORD).")
+            return
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT code FROM modalite WHERE tab = 'DEMANDE' AND pos = 3 ORDER BY pos_m LIMIT 3")
+            codes_demande = [row[0] for row in cursor.fetchall()] or ['A', 'B', 'C']
+            lookup, insert = scenario(conn, cursor, codes_demande)
+            print(f"--- Requêtes {label} ({iterations} appels) ---")
+            results[label] = (_report("lookup modalite", _timed(lookup, iterations)),
+                              _report("insert entretien + 3 demandes", _timed(insert, iterations)))
+        finally:
+            conn.rollback()
+            cursor.close()
+            conn.close()
+
+    (lk_c, ins_c), (lk_p, ins_p) = results["classique"], results["préparé"]
+    print("--- Gain par appel ---")
+    print(f"  lookup modalite : {lk_c - lk_p:+.3f} ms ({(1 - lk_p / lk_c) * 100:.0f} %)")
+    print(f"  insert complet  : {ins_c - ins_p:+.3f} ms ({(1 - ins_p / ins_c) * 100:.0f} %)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
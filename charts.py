@@ -0,0 +1,131 @@
+# =================================================================
+#  INDICATEURS ET GRAPHIQUES DE LA VUE GLOBALE (SANS STREAMLIT)
+# =================================================================
+# Utilisé par l'application et par le worker de précalcul (worker.py),
+# qui publie ces résultats à l'avance.
+
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+# --- CHARTE GRAPHIQUE ---
+COLOR_NAVY = "#122B48"
+COLOR_GOLD = "#B09B5B"
+
+# --- MODE GRANDS VOLUMES ---
+# Au-delà de LARGE_CHART_ROWS lignes, on n'envoie plus les valeurs brutes au
+# navigateur : effectifs par classe, quartiles, ou échantillon WebGL.
+LARGE_CHART_ROWS = int(os.getenv("LARGE_CHART_ROWS", "50000"))
+SCATTER_MAX_POINTS = int(os.getenv("SCATTER_MAX_POINTS", "20000"))
+HISTOGRAM_BINS = 50
+# Graine fixe : le même jeu de données donne toujours le même échantillon
+SAMPLE_SEED = 0
+
+
+def compute_kpis(df):
+    """Indicateurs des cartes du tableau de bord"""
+    return {
+        'total': len(df),
+        'top_commune': df["commune"].mode()[0] if "commune" in df.columns and not df["commune"].dropna().empty else "N/A",
+        'top_mode': df["mode"].mode()[0] if "mode" in df.columns and not df["mode"].dropna().empty else "N/A",
+        'top_age': df["age"].mode()[0] if "age" in df.columns and not df["age"].dropna().empty else "N/A",
+    }
+
+
+def build_global_figures(df, color_navy=COLOR_NAVY, color_gold=COLOR_GOLD):
+    """Graphiques de la VUE GLOBALE ; None pour une colonne absente"""
+    figures = {'sexe': None, 'age': None, 'commune': None}
+
+    if "sexe" in df.columns:
+        fig_sex = pie_chart(df, "sexe", title="Répartition par Sexe", palette=[color_navy, color_gold], hole=0.5)
+        fig_sex.update_layout(height=320, margin=dict(t=40, b=0, l=0, r=0))
+        figures['sexe'] = fig_sex
+
+    if "age" in df.columns:
+        if is_large(df):
+            ages = df["age"].value_counts(sort=False).rename_axis("age").reset_index(name="count")
+            fig_age = px.bar(ages, x="age", y="count", title="Distribution des Âges", color_discrete_sequence=[color_gold])
+        else:
+            fig_age = px.histogram(df, x="age", title="Distribution des Âges", color_discrete_sequence=[color_gold])
+        fig_age.update_xaxes(categoryorder='category ascending')
+        fig_age.update_layout(height=320, margin=dict(t=40, b=0, l=0, r=0), bargap=0.1)
+        figures['age'] = fig_age
+
+    if "commune" in df.columns:
+        commune_counts = df["commune"].value_counts().reset_index()
+        commune_counts.columns = ['Commune', 'Nombre']
+        fig_commune = px.bar(commune_counts, x="Nombre", y="Commune", orientation='h', title="Fréquentation par Commune", text_auto=True, color="Nombre", color_continuous_scale=[color_gold, color_navy])
+        fig_commune.update_layout(height=400, margin=dict(t=40, b=0, l=0, r=0))
+        figures['commune'] = fig_commune
+    return figures
+
+
+def box_from_quantiles(stats, x, y, color=None, palette=None, title=None):
+    """Boîte à moustache tracée à partir de quartiles déjà calculés (une ligne de stats par boîte)"""
+    fig = go.Figure()
+    groups = stats.groupby(color, sort=False) if color else [(y, stats)]
+    for i, (name, part) in enumerate(groups):
+        fig.add_trace(go.Box(x=part[x].tolist(), q1=part['q1'].tolist(), median=part['mediane'].tolist(),
+                             q3=part['q3'].tolist(), lowerfence=part['min'].tolist(), upperfence=part['max'].tolist(),
+                             name=str(name), marker_color=palette[i % len(palette)] if palette else None))
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=y, boxmode='group' if color else 'overlay')
+    return fig
+
+
+# =================================================================
+#  GRAPHIQUES GRANDS VOLUMES (DONNÉES RÉSUMÉES AVANT ENVOI)
+# =================================================================
+
+def is_large(df, threshold=None):
+    return len(df) > (LARGE_CHART_ROWS if threshold is None else threshold)
+
+
+def sample_points(df, max_points=None):
+    """Échantillon aléatoire reproductible d'au plus max_points lignes, dans l'ordre d'origine"""
+    max_points = SCATTER_MAX_POINTS if max_points is None else max_points
+    if len(df) <= max_points: return df
+    return df.sample(n=max_points, random_state=SAMPLE_SEED).sort_index()
+
+
+def scatter_gl(df, x, y, color=None, palette=None, title=None, max_points=None):
+    """Nuage de points WebGL (Scattergl) sur un échantillon ; le titre indique la part tracée"""
+    sample = sample_points(df, max_points)
+    if len(sample) < len(df):
+        title = f"{title or ''} (échantillon de {len(sample)} points sur {len(df)})".strip()
+    return px.scatter(sample, x=x, y=y, color=color, title=title, color_discrete_sequence=palette, render_mode='webgl')
+
+
+def bin_numeric(df, column, bins=HISTOGRAM_BINS):
+    """Remplace une colonne numérique trop détaillée par le centre de sa classe (bins classes égales)"""
+    if not pd.api.types.is_numeric_dtype(df[column]) or df[column].nunique() <= bins: return df
+    values = df[column].astype('float64')
+    edges = np.histogram_bin_edges(values.dropna(), bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    codes = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, bins - 1)
+    return df.assign(**{column: np.where(values.isna(), np.nan, centers[codes])})
+
+
+def pie_chart(df, names, title=None, palette=None, hole=0.4, threshold=None):
+    """Camembert ; en grand volume, une part par modalité (value_counts) au lieu d'une ligne par entretien"""
+    if not is_large(df, threshold):
+        return px.pie(df, names=names, title=title, color_discrete_sequence=palette, hole=hole)
+    counts = df[names].value_counts().rename_axis(names).reset_index(name="count")
+    return px.pie(counts, names=names, values="count", title=title, color_discrete_sequence=palette, hole=hole)
+
+
+def bars_from_aggregate(agg, x, y, color=None, palette=None, title=None):
+    """Barres groupées tracées à partir d'un agrégat déjà calculé (une ligne par barre)"""
+    return px.bar(agg, x=x, y=y, color=color, barmode="group", title=title, color_discrete_sequence=palette, text_auto=True)
+
+
+def quantile_summary(df, value, by):
+    """Statistiques d'une boîte à moustache par groupe, au format de box_from_quantiles"""
+    grouped = df.dropna(subset=[value]).groupby(list(by), observed=True)[value]
+    stats = grouped.agg(['min', 'median', 'max', 'count'])
+    stats['q1'] = grouped.quantile(0.25)
+    stats['q3'] = grouped.quantile(0.75)
+    stats = stats.rename(columns={'median': 'mediane', 'count': 'nb'})
+    return stats[['min', 'q1', 'mediane', 'q3', 'max', 'nb']].reset_index()
@@ -0,0 +1,95 @@
+# =================================================================
+#  PLAN DE TYPES DU DATAFRAME DE REPORTING
+# =================================================================
+# Les métadonnées du questionnaire (variable.type_v, plage) disent ce que
+# contient chaque colonne : on choisit le type pandas le plus étroit au
+# lieu de laisser pandas deviner (int64 / object partout).
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Au-delà de cette proportion de valeurs distinctes, une catégorie ne fait plus gagner de place
+CATEGORY_MAX_RATIO = 0.5
+
+# Entiers nullables (pd.NA) du plus étroit au plus large
+INT_TYPES = [('Int8', np.int8), ('Int16', np.int16), ('Int32', np.int32), ('Int64', np.int64)]
+
+
+def _int_type_for(val_min, val_max):
+    for name, np_type in INT_TYPES:
+        info = np.iinfo(np_type)
+        if info.min <= val_min and val_max <= info.max:
+            return name
+    return 'Int64'
+
+
+def _is_low_cardinality(series):
+    non_null = series.dropna()
+    return len(non_null) > 0 and non_null.nunique() <= CATEGORY_MAX_RATIO * len(non_null)
+
+
+def _is_date_column(series):
+    non_null = series.dropna()
+    return len(non_null) > 0 and isinstance(non_null.iloc[0], date)
+
+
+def _plan_integer(series, bounds=None):
+    """Entier nullable borné par la plage, sinon par les valeurs observées"""
+    values = pd.to_numeric(series, errors='coerce')
+    non_null = values.dropna()
+    if non_null.empty or not (non_null == non_null.round()).all():
+        return None
+    val_min, val_max = non_null.min(), non_null.max()
+    if bounds and bounds[0] is not None and bounds[1] is not None:
+        val_min, val_max = min(val_min, bounds[0]), max(val_max, bounds[1])
+    return _int_type_for(val_min, val_max)
+
+
+def build_dtype_plan(df, var_types):
+    """
+    Renvoie {colonne: type pandas}. var_types = {lib en minuscules:
+    {'type': MOD/NUM/CHAINE/DATE, 'min': ..., 'max': ...}}.
+    """
+    plan = {}
+    for col in df.columns:
+        series = df[col]
+        meta = var_types.get(col, {})
+        type_v = meta.get('type')
+
+        if type_v == 'DATE' or _is_date_column(series):
+            plan[col] = 'datetime64[ns]'
+        elif type_v == 'NUM':
+            plan[col] = _plan_integer(series, (meta.get('min'), meta.get('max'))) or 'float32'
+        elif type_v in ('MOD', 'CHAINE') and _is_low_cardinality(series):
+            plan[col] = 'category'
+        elif pd.api.types.is_numeric_dtype(series):
+            # Colonnes sans métadonnée exploitable (identifiant...) : entier le plus étroit
+            int_type = _plan_integer(series)
+            if int_type: plan[col] = int_type
+    return plan
+
+
+def apply_dtype_plan(df, plan):
+    for col, dtype in plan.items():
+        try:
+            if dtype == 'datetime64[ns]':
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+            elif dtype.startswith('Int') or dtype == 'float32':
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+            else:
+                df[col] = df[col].astype(dtype)
+        except (ValueError, TypeError):
+            # Valeur hors plan (donnée corrompue) : on garde le type d'origine
+            continue
+    return df
+
+
+def optimize_frame(df, var_types):
+    """Applique le plan et note l'empreinte mémoire avant / après dans df.attrs"""
+    before = int(df.memory_usage(deep=True).sum())
+    df = apply_dtype_plan(df, build_dtype_plan(df, var_types))
+    after = int(df.memory_usage(deep=True).sum())
+    df.attrs['memoire'] = {'avant': before, 'apres': after}
+    return df
@@ -0,0 +1,153 @@
+"""
+Export en flux des entretiens décodés (CSV ou XLSX).
+
+Les lignes sont lues par paquets depuis un curseur côté serveur : seul le
+paquet courant est en mémoire, quel que soit le volume exporté.
+
+Usage en ligne de commande :
+    python export.py sortie.csv [--xlsx] [--demandes] [--solutions] [--debut 2024-01-01] [--fin 2024-12-31]
+"""
+import argparse
+from datetime import date
+
+import pandas as pd
+from psycopg2.extras import RealDictCursor
+
+import backend
+
+CHUNK_SIZE = 5000
+CSV_SEPARATOR = ';'  # Séparateur attendu par Excel en français
+
+# Sous-requêtes : demandes / solutions d'un entretien, décodées et concaténées
+SQL_DEMANDES = ("(SELECT string_agg(COALESCE(m.lib_m, d.nature), ' | ' ORDER BY d.pos) FROM demande d "
+                "LEFT JOIN modalite m ON m.tab = 'DEMANDE' AND m.pos = 3 AND m.code = d.nature "
+                "WHERE d.num = e.num{partition}) AS demandes")
+SQL_SOLUTIONS = ("(SELECT string_agg(COALESCE(m.lib_m, s.nature), ' | ' ORDER BY s.pos) FROM solution s "
+                 "LEFT JOIN modalite m ON m.tab = 'SOLUTION' AND m.pos = 3 AND m.code = s.nature "
+                 "WHERE s.num = e.num{partition}) AS solutions")
+# Tables partitionnées : la date de l'entretien (recopiée dans demande / solution)
+# limite la recherche à la partition de son année, ou à la partition par défaut sans date
+SQL_PARTITION = " AND ({alias}.date_ent = e.date_ent OR e.date_ent IS NULL AND {alias}.date_ent IS NULL)"
+
+
+def build_export_query(filters=None, with_demandes=False, with_solutions=False, partitioned=False):
+    """Construit (sql, params) ; seules les colonnes connues d'entretien sont filtrables"""
+    filters = filters or {}
+    select = ["e.*"]
+    if with_demandes: select.append(SQL_DEMANDES.format(partition=SQL_PARTITION.format(alias='d') if partitioned else ''))
+    if with_solutions: select.append(SQL_SOLUTIONS.format(partition=SQL_PARTITION.format(alias='s') if partitioned else ''))
+
+    where, params = [], []
+    if filters.get('date_debut'):
+        where.append("e.date_ent >= %s")
+        params.append(filters['date_debut'])
+    if filters.get('date_fin'):
+        where.append("e.date_ent <= %s")
+        params.append(filters['date_fin'])
+    for col in backend.ENTRETIEN_COLUMNS:
+        values = filters.get(col)
+        if values:
+            where.append(f"e.{col} = ANY(%s)")
+            params.append(list(values))
+
+    sql = "SELECT " + ", ".join(select) + " FROM entretien e"
+    if where: sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY e.num", params
+
+
+def iter_export_chunks(conn, filters=None, with_demandes=False, with_solutions=False, chunk_size=CHUNK_SIZE):
+    """Génère des DataFrames décodés de chunk_size lignes au plus"""
+    meta_cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        vars_map, decodage_map, var_types = backend.get_decoding_maps(meta_cursor)
+    finally:
+        meta_cursor.close()
+    plain_cursor = conn.cursor()
+    try:
+        partitioned = backend.is_partitioned(plain_cursor)
+    finally:
+        plain_cursor.close()
+
+    sql, params = build_export_query(filters, with_demandes, with_solutions, partitioned)
+    # Curseur nommé = curseur côté serveur (DECLARE ... / FETCH n)
+    cursor = conn.cursor(name='export_entretiens', cursor_factory=RealDictCursor)
+    cursor.itersize = chunk_size
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows: break
+            yield backend.decode_entretiens(backend.expand_attributes(pd.DataFrame(rows), var_types), vars_map, decodage_map)
+    finally:
+        cursor.close()
+
+
+def write_csv(chunks, fileobj):
+    total = 0
+    for chunk in chunks:
+        chunk.to_csv(fileobj, sep=CSV_SEPARATOR, index=False, header=(total == 0))
+        total += len(chunk)
+    return total
+
+
+def _xlsx_cell(value):
+    if value is None or (not isinstance(value, (str, date)) and pd.isna(value)): return None
+    return value
+
+
+def write_xlsx(chunks, fileobj):
+    # Dépendance optionnelle : uniquement nécessaire pour l'export Excel
+    from openpyxl import Workbook
+
+    # Mode write_only : les lignes partent dans un fichier temporaire au fil de l'eau
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Entretiens")
+    total = 0
+    for chunk in chunks:
+        if total == 0: ws.append(list(chunk.columns))
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append([_xlsx_cell(v) for v in row])
+        total += len(chunk)
+    wb.save(fileobj)
+    return total
+
+
+def export_entretiens(path, fmt='csv', filters=None, with_demandes=False, with_solutions=False, chunk_size=CHUNK_SIZE):
+    """Écrit l'export dans path ; renvoie le nombre de lignes, None en cas d'erreur"""
+    # Connexion dédiée : un long export ne monopolise pas celle des tableaux de bord
+    conn = backend.init_reporting_connection()
+    if conn is None: return None
+    try:
+        # Un curseur côté serveur vit dans une transaction (lecture seule)
+        conn.set_session(readonly=True, autocommit=False)
+        chunks = iter_export_chunks(conn, filters, with_demandes, with_solutions, chunk_size)
+        if fmt == 'xlsx':
+            with open(path, 'wb') as f:
+                return write_xlsx(chunks, f)
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            return write_csv(chunks, f)
+    except Exception as e:
+        print("❌ ERREUR EXPORT :", e)
+        return None
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export des entretiens décodés")
+    parser.add_argument("sortie")
+    parser.add_argument("--xlsx", action="store_true", help="Export Excel au lieu de CSV")
+    parser.add_argument("--demandes", action="store_true")
+    parser.add_argument("--solutions", action="store_true")
+    parser.add_argument("--debut", type=date.fromisoformat)
+    parser.add_argument("--fin", type=date.fromisoformat)
+    args = parser.parse_args()
+
+    nb = export_entretiens(args.sortie, 'xlsx' if args.xlsx else 'csv',
+                           {'date_debut': args.debut, 'date_fin': args.fin}, args.demandes, args.solutions)
+    print(f"✅ {nb} entretiens exportés dans {args.sortie}" if nb is not None else "❌ Export impossible.")
+
+
+if __name__ == "__main__":
+    main()
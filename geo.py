@@ -0,0 +1,127 @@
+# =================================================================
+#  RÉFÉRENTIEL GÉOGRAPHIQUE (AGGLO -> COMMUNE -> QUARTIER)
+# =================================================================
+# Module "pur" (aucun accès BDD) : le backend lui fournit les lignes des
+# tables agglo / commune / quartier et il se charge de :
+#   - construire un index nom -> code,
+#   - rattacher le texte libre de entretien.commune à un code commune
+#     (normalisation, abréviations, rapprochement approché borné),
+#   - calculer les clés du cube (niveau, code) à incrémenter.
+
+import difflib
+import re
+
+from autocomplete import fold_text
+
+NIVEAU_AGGLO = 'AGGLO'
+NIVEAU_COMMUNE = 'COMMUNE'
+NIVEAU_QUARTIER = 'QUARTIER'
+NIVEAUX = (NIVEAU_AGGLO, NIVEAU_COMMUNE, NIVEAU_QUARTIER)
+
+# Code réservé aux entretiens non rattachés (commune inconnue ou hors agglo)
+CODE_NON_LOCALISE = 0
+LIB_NON_LOCALISE = "Non localisé"
+
+# Abréviations courantes des noms de lieux (après repli en minuscules sans accents)
+ABREVIATIONS = {'st': 'saint', 'ste': 'sainte', 'sts': 'saints', 'stes': 'saintes'}
+PONCTUATION = re.compile(r"[-'’_./,]")
+
+# Rapprochement approché borné : similarité minimale et écart de longueur maximal
+FUZZY_CUTOFF = 0.85
+FUZZY_MAX_LEN_DIFF = 2
+
+
+def normalize_name(text):
+    """Forme de comparaison : sans accents, casse, ponctuation ni abréviations ('St-Avé' -> 'saint ave')"""
+    key = PONCTUATION.sub(" ", fold_text(text))
+    return " ".join(ABREVIATIONS.get(word, word) for word in key.split())
+
+
+def _quartier_aliases(ref):
+    """'Vannes Kercado' -> 'vannes k' quand l'initiale est unique dans la commune"""
+    by_initial = {}
+    for code_q, qua in ref['quartiers'].items():
+        commune = normalize_name(ref['communes'].get(qua['code_c'], {}).get('nom'))
+        name = normalize_name(qua['nom'])
+        if not commune or not name.startswith(commune + " "): continue
+        alias = f"{commune} {name[len(commune) + 1]}"
+        by_initial.setdefault(alias, []).append(code_q)
+    return {alias: codes[0] for alias, codes in by_initial.items() if len(codes) == 1}
+
+
+def build_geo_reference(agglos, communes, quartiers):
+    """Construit le référentiel à partir des lignes (dicts) des trois tables"""
+    ref = {
+        'agglos': {a['code_a']: a['nom_a'] for a in agglos},
+        'communes': {c['code_c']: {'nom': c['nom_c'], 'code_a': c['code_a']} for c in communes},
+        'quartiers': {q['code_q']: {'nom': q['nom_q'], 'code_c': q['code_c']} for q in quartiers},
+    }
+    # Un seul index nom normalisé -> (code_c, code_q) ; priorité aux quartiers, puis aux communes
+    index = {}
+    for code_q, qua in ref['quartiers'].items():
+        index.setdefault(normalize_name(qua['nom']), (qua['code_c'], code_q))
+    for code_c, com in ref['communes'].items():
+        index.setdefault(normalize_name(com['nom']), (code_c, None))
+    index.pop("", None)
+    ref['index'] = index
+    ref['alias'] = _quartier_aliases(ref)
+
+    # Candidats du rapprochement approché (noms complets), regroupés par première lettre
+    ref['candidats'] = {}
+    for key in index:
+        ref['candidats'].setdefault(key[0], []).append(key)
+    return ref
+
+
+def _fuzzy_key(key, ref):
+    candidates = [c for c in ref['candidats'].get(key[0], []) if abs(len(c) - len(key)) <= FUZZY_MAX_LEN_DIFF]
+    matches = difflib.get_close_matches(key, candidates, n=1, cutoff=FUZZY_CUTOFF)
+    return matches[0] if matches else None
+
+
+def resolve_commune(text, ref, fuzzy=True):
+    """Rattache un texte libre à (code_c, code_q) ; (None, None) si inconnu"""
+    key = normalize_name(text)
+    if not key: return None, None
+    if key in ref['index']: return ref['index'][key]
+
+    # "Vannes K" : commune (éventuellement mal orthographiée) + initiale du quartier
+    head, _, initial = key.rpartition(" ")
+    if head and len(initial) == 1:
+        match = head if head in ref['index'] else (_fuzzy_key(head, ref) if fuzzy else None)
+        if match:
+            code_c, code_q = ref['index'][match]
+            alias = ref['alias'].get(f"{match} {initial}")
+            return (code_c, alias) if alias is not None else (code_c, code_q)
+
+    match = _fuzzy_key(key, ref) if fuzzy else None
+    return ref['index'][match] if match else (None, None)
+
+
+def resolve_many(texts, ref):
+    """Résolution d'un lot : chaque texte distinct n'est traité qu'une fois"""
+    return {text: resolve_commune(text, ref) for text in set(texts)}
+
+
+def cube_keys(code_c, code_q, ref):
+    """Liste des cellules (niveau, code) du cube touchées par un entretien"""
+    if code_c is None:
+        return [(NIVEAU_AGGLO, CODE_NON_LOCALISE), (NIVEAU_COMMUNE, CODE_NON_LOCALISE)]
+
+    code_a = ref['communes'].get(code_c, {}).get('code_a')
+    keys = [
+        (NIVEAU_AGGLO, code_a if code_a is not None else CODE_NON_LOCALISE),
+        (NIVEAU_COMMUNE, code_c),
+    ]
+    if code_q is not None:
+        keys.append((NIVEAU_QUARTIER, code_q))
+    return keys
+
+
+def rollup_counts(counts_by_codes, ref):
+    """Agrège {(code_c, code_q): nb} en {(niveau, code): nb} sur les trois niveaux"""
+    cube = {}
+    for (code_c, code_q), nb in counts_by_codes.items():
+        for key in cube_keys(code_c, code_q, ref):
+            cube[key] = cube.get(key, 0) + nb
+    return cube
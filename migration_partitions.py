@@ -0,0 +1,41 @@
+"""
+Partitionnement annuel des entretiens (entretien, demande, solution).
+
+    python migration_partitions.py migrer          # bascule unique des tables existantes
+    python migration_partitions.py creer           # partitions de l'année en cours et de la suivante
+    python migration_partitions.py archiver 2019   # détache l'année 2019 (tables conservées)
+    python migration_partitions.py lister
+
+La migration recopie toutes les lignes dans une seule transaction : à lancer
+hors des heures de saisie, après une sauvegarde. L'historique sans date
+(date_ent vide) va dans les partitions *_sans_date.
+"""
+import argparse
+
+import backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partitionnement annuel des entretiens")
+    sub = parser.add_subparsers(dest="action", required=True)
+    sub.add_parser("migrer")
+    sub.add_parser("creer")
+    archiver = sub.add_parser("archiver")
+    archiver.add_argument("annee", type=int)
+    sub.add_parser("lister")
+    args = parser.parse_args()
+
+    if args.action == "migrer":
+        ok = backend.migrate_to_partitions()
+        print("✅ Tables partitionnées par année." if ok else "❌ Migration non effectuée (déjà faite ou erreur).")
+    elif args.action == "creer":
+        print("✅ Partitions à jour." if backend.ensure_partitions() else "❌ Création impossible.")
+    elif args.action == "archiver":
+        ok = backend.archive_partition(args.annee)
+        print(f"✅ Année {args.annee} détachée (tables *_{args.annee} conservées)." if ok else "❌ Archivage impossible.")
+    if args.action in ("migrer", "lister"):
+        print(backend.list_partitions().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# =================================================================
+#  PARTITIONNEMENT ANNUEL (ENTRETIEN / DEMANDE / SOLUTION)
+# =================================================================
+# Module "pur" (aucun accès BDD) : il génère les ordres DDL, le backend
+# les exécute.
+#   - entretien est partitionné par plage sur date_ent : une partition par
+#     année, plus une partition par défaut pour l'historique sans date ;
+#   - demande / solution portent une copie de date_ent et suivent le même
+#     découpage. Chaque partition a sa clé primaire et sa clé étrangère vers
+#     la partition entretien de la même année : une année s'archive en
+#     détachant trois tables cohérentes entre elles (DETACH, pas de DELETE).
+
+from datetime import date
+
+PARENT = 'entretien'
+# Tables liées -> colonnes de leur clé primaire
+CHILDREN = {'demande': ('num', 'pos'), 'solution': ('num', 'pos')}
+TABLES = (PARENT,) + tuple(CHILDREN)
+DEFAULT_SUFFIX = 'sans_date'
+# Suffixe des anciennes tables pendant la migration
+OLD_SUFFIX = 'ancien'
+
+
+def partition_name(table, year=None):
+    """'entretien_2025' ; 'entretien_sans_date' pour la partition par défaut"""
+    return f"{table}_{year}" if year is not None else f"{table}_{DEFAULT_SUFFIX}"
+
+
+def year_bounds(year):
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def years_ahead(today=None, ahead=1):
+    """Années dont les partitions doivent exister : l'année en cours et les suivantes"""
+    today = today or date.today()
+    return list(range(today.year, today.year + ahead + 1))
+
+
+def partition_ddl(year=None):
+    """Création des trois partitions d'une année (None : partitions par défaut)"""
+    if year is None:
+        bound = "DEFAULT"
+    else:
+        start, end = year_bounds(year)
+        bound = f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    parent = partition_name(PARENT, year)
+    ddl = [f"CREATE TABLE IF NOT EXISTS {parent} PARTITION OF {PARENT} (PRIMARY KEY (num)) {bound}"]
+    for child, pk in CHILDREN.items():
+        ddl.append(f"CREATE TABLE IF NOT EXISTS {partition_name(child, year)} PARTITION OF {child} "
+                   f"(PRIMARY KEY ({', '.join(pk)}), FOREIGN KEY (num) REFERENCES {parent} (num)) {bound}")
+    return ddl
+
+
+def default_rows_ddl(year):
+    """
+    Lignes de l'année tombées dans la partition par défaut (partition de l'année
+    absente au moment de la saisie) : PostgreSQL refuse de créer la partition
+    tant qu'elles y sont. Renvoie (avant, après) : mise de côté et suppression
+    avant partition_ddl(year), réinsertion (routée vers la nouvelle partition) après.
+    """
+    start, end = year_bounds(year)
+    moved = {table: f"deplace_{table}" for table in TABLES}
+    before = [f"CREATE TEMP TABLE {moved[PARENT]} AS SELECT * FROM {partition_name(PARENT)} "
+              f"WHERE date_ent >= '{start}' AND date_ent < '{end}'"]
+    for child in CHILDREN:
+        before.append(f"CREATE TEMP TABLE {moved[child]} AS SELECT * FROM {partition_name(child)} "
+                      f"WHERE num IN (SELECT num FROM {moved[PARENT]})")
+        before.append(f"DELETE FROM {partition_name(child)} WHERE num IN (SELECT num FROM {moved[PARENT]})")
+    before.append(f"DELETE FROM {partition_name(PARENT)} WHERE num IN (SELECT num FROM {moved[PARENT]})")
+
+    after = [f"INSERT INTO {PARENT} SELECT * FROM {moved[PARENT]}"]
+    for child in CHILDREN:
+        after.append(f"UPDATE {moved[child]} c SET date_ent = e.date_ent FROM {moved[PARENT]} e "
+                     f"WHERE e.num = c.num AND c.date_ent IS DISTINCT FROM e.date_ent")
+        after.append(f"INSERT INTO {child} SELECT * FROM {moved[child]}")
+    after.append("DROP TABLE " + ", ".join(moved[table] for table in TABLES))
+    return before, after
+
+
+def detach_ddl(year):
+    """Archivage d'une année : tables liées d'abord, entretien ensuite"""
+    return [f"ALTER TABLE {table} DETACH PARTITION {partition_name(table, year)}"
+            for table in tuple(CHILDREN) + (PARENT,)]
+
+
+def migration_ddl(years, parent_foreign_keys=()):
+    """
+    Bascule des tables classiques vers les tables partitionnées, dans une
+    seule transaction : renommage, création des parents et des partitions
+    (années présentes + défaut), recopie, puis suppression des anciennes tables.
+    parent_foreign_keys : (nom, définition pg_get_constraintdef) des clés
+    étrangères d'entretien à reporter sur la nouvelle table.
+    """
+    old = {table: f"{table}_{OLD_SUFFIX}" for table in TABLES}
+    ddl = [f"ALTER TABLE {table} RENAME TO {old[table]}" for table in TABLES]
+    # La séquence de num survit à la suppression de l'ancienne table
+    ddl.append(f"ALTER SEQUENCE {PARENT}_num_seq OWNED BY NONE")
+    for table in TABLES:
+        ddl.append(f"CREATE TABLE {table} (LIKE {old[table]} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                   f"PARTITION BY RANGE (date_ent)")
+    ddl += [f"ALTER TABLE {PARENT} ADD CONSTRAINT {name} {fk}" for name, fk in parent_foreign_keys]
+    for year in [None] + sorted(set(years)):
+        ddl += partition_ddl(year)
+
+    ddl.append(f"INSERT INTO {PARENT} SELECT * FROM {old[PARENT]}")
+    for child in CHILDREN:
+        ddl.append(f"UPDATE {old[child]} c SET date_ent = e.date_ent FROM {old[PARENT]} e "
+                   f"WHERE e.num = c.num AND c.date_ent IS DISTINCT FROM e.date_ent")
+        ddl.append(f"INSERT INTO {child} SELECT * FROM {old[child]}")
+
+    ddl.append(f"ALTER SEQUENCE {PARENT}_num_seq OWNED BY {PARENT}.num")
+    ddl.append("DROP TABLE " + ", ".join(old[table] for table in tuple(CHILDREN) + (PARENT,)))
+    return ddl
@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import os
+import tempfile
 from datetime import date
 
 # --- IMPORT DES FONCTIONS MÉTIER (BACKEND) ---
@@ -13,8 +15,25 @@ from backend import (
     insert_demandes,
     insert_solutions,
     get_data_for_reporting,
-    upsert_rubrique
+    upsert_rubrique,
+    ensure_schema,
+    ensure_partitions,
+    rebuild_geo_cube,
+    resolve_communes_history,
+    get_geo_rollup,
+    get_entretiens_page,
+    check_entretien,
+    audit_entretiens,
+    get_autocomplete_indexes
 )
+from geo import NIVEAU_AGGLO, NIVEAU_COMMUNE, NIVEAU_QUARTIER
+from export import export_entretiens
+from validation import summarize_violations
+import aggregation
+import analytics
+import autocomplete
+import charts
+import snapshot
 
 # --- CONSTANTES ---
 LABEL_COUNT = "(Compte des dossiers)"
@@ -33,8 +52,8 @@ st.set_page_config(
 
 def load_css():
     """Charge le style CSS de l'application"""
-    COLOR_NAVY = "#122B48"
-    COLOR_GOLD = "#B09B5B"
+    COLOR_NAVY = charts.COLOR_NAVY
+    COLOR_GOLD = charts.COLOR_GOLD
     COLOR_BG_SIDEBAR = "#F0F2F6"
     COLOR_TEXT_GREY = "#666666"
 
@@ -104,7 +123,7 @@ def show_sidebar(color_navy):
         st.markdown("---")
         menu_selection = st.radio(
             "NAVIGATION",
-            ["ALIMENTATION", "VISUALISATION", "CONFIGURATION"],
+            ["ALIMENTATION", "VISUALISATION", "CONSULTATION", "CONFIGURATION"],
             index=0
         )
         st.markdown("---")
@@ -117,10 +136,39 @@ def show_sidebar(color_navy):
 #  LOGIQUE DES PAGES (REFACTORISÉE)
 # =================================================================
 
-def render_form_inputs(structure, color_navy): # pragma: no cover
-    """Helper pour générer les champs du formulaire"""
+def autocomplete_variables(structure, indexes): # pragma: no cover
+    """Variables CHAINE dotées d'un index de libellés (saisies hors du formulaire)"""
+    return [var for variables in structure.values() for var in variables
+            if var['type'] == 'CHAINE' and (indexes.get(var['lib'].lower()) or {}).get('keys')]
+
+def render_autocomplete_inputs(variables, indexes, color_navy): # pragma: no cover
+    """
+    Champs texte avec suggestions, hors du st.form : chaque saisie relance la page
+    et les suggestions viennent de l'index de préfixes (sans accents ni casse).
+    """
+    data = {}
+    if not variables: return data
+    st.markdown(f"<div style='background-color: #E8EBF0; padding: 10px; border-radius: 5px; margin-bottom: 10px;'><h4 style='color: {color_navy}; margin:0;'>Champs avec suggestions</h4></div>", unsafe_allow_html=True)
+    cols = st.columns(2)
+    for i, var in enumerate(variables):
+        lib, index = var['lib'], indexes[var['lib'].lower()]
+        with cols[i % 2]:
+            typed = st.text_input(f"**{lib}**", key=f"f_{lib}", help=var['comment'])
+            suggestions = autocomplete.complete(index, typed)
+            choice = None
+            if suggestions:
+                choice = st.selectbox(f"Suggestions pour « {typed} »", suggestions, index=None,
+                                      placeholder="Garder la saisie", key=f"s_{lib}")
+            # Valeur nouvelle possible, ramenée au libellé de référence ("nantes " -> "Nantes")
+            data[lib.lower()] = choice or autocomplete.canonical(index, typed)
+    return data
+
+def render_form_inputs(structure, color_navy, skip=()): # pragma: no cover
+    """Helper pour générer les champs du formulaire ; skip : variables saisies hors du formulaire"""
     data = {}
     for rubrique, variables in structure.items():
+        variables = [var for var in variables if var['lib'] not in skip]
+        if not variables: continue
         st.markdown(f"<div style='background-color: #E8EBF0; padding: 10px; border-radius: 5px; margin-bottom: 10px;'><h4 style='color: {color_navy}; margin:0;'>{rubrique}</h4></div>", unsafe_allow_html=True)
         cols = st.columns(2)
         for i, var in enumerate(variables):
@@ -148,8 +196,13 @@ def page_alimentation(color_navy): # pragma: no cover
         st.error("Impossible de charger les rubriques.")
         return
 
+    indexes = get_autocomplete_indexes()
+    suggested = autocomplete_variables(structure, indexes)
+    data_suggested = render_autocomplete_inputs(suggested, indexes, color_navy)
+
     with st.form(key='main_form'):
-        data_entretien = render_form_inputs(structure, color_navy)
+        data_entretien = render_form_inputs(structure, color_navy, skip={var['lib'] for var in suggested})
+        data_entretien.update(data_suggested)
         
         st.markdown("---")
         col_d, col_s = st.columns(2)
@@ -166,8 +219,12 @@ def page_alimentation(color_navy): # pragma: no cover
             submitted = st.form_submit_button("💾 ENREGISTRER L'ENTRETIEN", use_container_width=True)
 
         if submitted:
+            violations = check_entretien(data_entretien)
             if not sel_dem:
                 st.error("Sélectionnez au moins une demande.")
+            elif violations is not None and not violations.empty:
+                st.error("❌ Entretien non enregistré : des réponses ne respectent pas le questionnaire.")
+                st.dataframe(violations[['colonne', 'valeur', 'regle']], hide_index=True)
             else:
                 new_id = insert_full_entretien(data_entretien)
                 if new_id:
@@ -186,81 +243,127 @@ def page_alimentation(color_navy): # pragma: no cover
                     else:
                         st.warning("⚠️ DIAGNOSTIC : Connexion OK mais l'insertion SQL a échoué. Vérifie les données saisies.")
 
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_reporting_snapshot(version): # pragma: no cover
+    """Précalcul publié par worker.py (relu seulement quand il change) ; une seule version gardée,
+    partagée par toutes les sessions sans copie : à traiter en lecture seule"""
+    return snapshot.read(snapshot.REPORTING, max_age=None) if version else None
+
 def page_visualisation(color_navy, color_gold, palette): # pragma: no cover
     st.title("Tableau de Bord Décisionnel")
-    df = get_data_for_reporting()
+    snap = load_reporting_snapshot(snapshot.snapshot_mtime(snapshot.REPORTING))
+    if snapshot.is_fresh(snap):
+        df, kpis, figures = snap['df'], snap['kpis'], snap['figures']
+    else:
+        # Pas de worker actif : calcul direct dans la page
+        df = get_data_for_reporting()
+        kpis, figures = None, None
     
     if df.empty:
         st.info("Aucune donnée disponible pour le moment.")
         return
+    if kpis is None:
+        kpis, figures = charts.compute_kpis(df), charts.build_global_figures(df, color_navy, color_gold)
+
+    memoire = df.attrs.get('memoire')
+    if memoire:
+        st.caption(f"Données chargées : {len(df)} entretiens, {memoire['apres'] / 1024:.0f} Ko en mémoire (contre {memoire['avant'] / 1024:.0f} Ko sans typage).")
 
-    subtab_global, subtab_creator = st.tabs(["VUE GLOBALE", "CRÉATEUR DE GRAPHIQUES"])
+    subtab_global, subtab_geo, subtab_creator = st.tabs(["VUE GLOBALE", "VUE TERRITORIALE", "CRÉATEUR DE GRAPHIQUES"])
 
     with subtab_global:
         st.markdown("### Indicateurs de Performance")
         k1, k2, k3, k4 = st.columns(4)
         
-        total = len(df)
-        top_commune = df["commune"].mode()[0] if not df["commune"].empty else "N/A"
-        top_mode = df["mode"].mode()[0] if not df["mode"].empty else "N/A"
-        top_age = df["age"].mode()[0] if "age" in df.columns and not df["age"].empty else "N/A"
-        
-        with k1: st.markdown(f"""<div class="kpi-card"><div class="kpi-title">Total Dossiers</div><div class="kpi-value">{total}</div><div class="kpi-sub">Entretiens réalisés</div></div>""", unsafe_allow_html=True)
-        with k2: st.markdown(f"""<div class="kpi-card"><div class="kpi-title">Top Commune</div><div class="kpi-value" style="font-size:2.2rem;">{top_commune}</div><div class="kpi-sub">Provenance majeure</div></div>""", unsafe_allow_html=True)
-        with k3: st.markdown(f"""<div class="kpi-card"><div class="kpi-title">Mode Dominant</div><div class="kpi-value" style="font-size:2.2rem;">{top_mode}</div><div class="kpi-sub">Type de contact</div></div>""", unsafe_allow_html=True)
-        with k4: st.markdown(f"""<div class="kpi-card"><div class="kpi-title">Âge Dominant</div><div class="kpi-value" style="font-size:2.2rem;">{top_age}</div><div class="kpi-sub">Tranche majoritaire</div></div>""", unsafe_allow_html=True)
+        with k1: st.markdown(f"""<div class="kpi-card"><div class="kpi-title">Total Dossiers</div><div class="kpi-value">{kpis['total']}</div><div class="kpi-sub">Entretiens réalisés</div></div>""", unsafe_allow_html=True)
+        with k2: st.markdown(f"""<div class="kpi-card"><div class="kpi-title">Top Commune</div><div class="kpi-value" style="font-size:2.2rem;">{kpis['top_commune']}</div><div class="kpi-sub">Provenance majeure</div></div>""", unsafe_allow_html=True)
+        with k3: st.markdown(f"""<div class="kpi-card"><div class="kpi-title">Mode Dominant</div><div class="kpi-value" style="font-size:2.2rem;">{kpis['top_mode']}</div><div class="kpi-sub">Type de contact</div></div>""", unsafe_allow_html=True)
+        with k4: st.markdown(f"""<div class="kpi-card"><div class="kpi-title">Âge Dominant</div><div class="kpi-value" style="font-size:2.2rem;">{kpis['top_age']}</div><div class="kpi-sub">Tranche majoritaire</div></div>""", unsafe_allow_html=True)
 
         st.markdown("---")
         col_main1, col_main2 = st.columns([1, 1], gap="small")
         
         with col_main1:
-            fig_sex = px.pie(df, names="sexe", title="Répartition par Sexe", hole=0.5, color_discrete_sequence=[color_navy, color_gold])
-            fig_sex.update_layout(height=320, margin=dict(t=40, b=0, l=0, r=0))
-            st.plotly_chart(fig_sex, use_container_width=True)
+            if figures['sexe']:
+                st.plotly_chart(figures['sexe'], use_container_width=True)
             
         with col_main2:
-            if "age" in df.columns:
-                fig_age = px.histogram(df, x="age", title="Distribution des Âges", color_discrete_sequence=[color_gold])
-                fig_age.update_xaxes(categoryorder='category ascending')
-                fig_age.update_layout(height=320, margin=dict(t=40, b=0, l=0, r=0), bargap=0.1)
-                st.plotly_chart(fig_age, use_container_width=True)
+            if figures['age']:
+                st.plotly_chart(figures['age'], use_container_width=True)
             else:
                 st.warning("Données d'âge non disponibles.")
 
-        if "commune" in df.columns:
-            commune_counts = df["commune"].value_counts().reset_index()
-            commune_counts.columns = ['Commune', 'Nombre']
-            fig_commune = px.bar(commune_counts, x="Nombre", y="Commune", orientation='h', title="Fréquentation par Commune", text_auto=True, color="Nombre", color_continuous_scale=[color_gold, color_navy])
-            fig_commune.update_layout(height=400, margin=dict(t=40, b=0, l=0, r=0))
-            st.plotly_chart(fig_commune, use_container_width=True)
+        if figures['commune']:
+            st.plotly_chart(figures['commune'], use_container_width=True)
+
+    with subtab_geo:
+        render_geo_drilldown(color_navy, color_gold)
 
     with subtab_creator:
         render_chart_creator(df, palette)
 
-def _create_bar_chart(df, var_x, var_y, var_color, palette, title):
+def _geo_bar_chart(df_geo, title, color_navy, color_gold):
+    fig = px.bar(df_geo, x="nb", y="lib", orientation='h', title=title, text_auto=True,
+                 labels={"nb": "Nombre", "lib": ""}, color="nb", color_continuous_scale=[color_gold, color_navy])
+    fig.update_layout(height=max(300, 28 * len(df_geo)), margin=dict(t=40, b=0, l=0, r=0), yaxis={'categoryorder': 'total ascending'})
+    return fig
+
+def render_geo_drilldown(color_navy, color_gold): # pragma: no cover
+    """Exploration Agglo -> Commune -> Quartier sur le cube précalculé"""
+    st.markdown("### Fréquentation par territoire")
+    df_agglo = get_geo_rollup(NIVEAU_AGGLO)
+    if df_agglo.empty:
+        st.info("Cube géographique vide : aucune donnée territoriale.")
+        return
+    st.plotly_chart(_geo_bar_chart(df_agglo, "Entretiens par agglomération", color_navy, color_gold), use_container_width=True)
+
+    agglos = dict(zip(df_agglo["lib"], df_agglo["code"]))
+    choix_agglo = st.selectbox("Détailler une agglomération :", list(agglos.keys()), index=None)
+    if choix_agglo is None: return
+
+    df_commune = get_geo_rollup(NIVEAU_COMMUNE, agglos[choix_agglo])
+    st.plotly_chart(_geo_bar_chart(df_commune, f"Entretiens par commune : {choix_agglo}", color_navy, color_gold), use_container_width=True)
+
+    communes = dict(zip(df_commune["lib"], df_commune["code"]))
+    choix_commune = st.selectbox("Détailler une commune :", list(communes.keys()), index=None)
+    if choix_commune is None: return
+
+    df_quartier = get_geo_rollup(NIVEAU_QUARTIER, communes[choix_commune])
+    if df_quartier.empty:
+        st.info("Aucun entretien rattaché à un quartier prioritaire pour cette commune.")
+    else:
+        st.plotly_chart(_geo_bar_chart(df_quartier, f"Quartiers prioritaires : {choix_commune}", color_navy, color_gold), use_container_width=True)
+
+def _create_bar_chart(df, var_x, var_y, var_color, palette, title, engine=False):
+    if charts.is_large(df):
+        # Barres pré-agrégées : une ligne par barre envoyée au navigateur, pas une par entretien
+        binned = charts.bin_numeric(df, var_x)
+        # X numérique regroupé en classes : la copie analytique (valeurs brutes) ne convient plus
+        df_agg = _aggregate(binned, [var_x] + ([var_color] if var_color else []), var_y, 'mean', engine and binned is df)
+        return charts.bars_from_aggregate(df_agg, var_x, 'Compte' if var_y == LABEL_COUNT else var_y, var_color, palette, title)
     if var_y == LABEL_COUNT:
         return px.histogram(df, x=var_x, color=var_color, barmode="group", title=title, color_discrete_sequence=palette, text_auto=True)
     return px.histogram(df, x=var_x, y=var_y, color=var_color, barmode="group", title=title, histfunc='avg', color_discrete_sequence=palette, text_auto=True)
 
-def _create_line_chart(df, var_x, var_y, var_color, palette, title):
-    if var_y == LABEL_COUNT:
-        df_agg = df.groupby([var_x] + ([var_color] if var_color else [])).size().reset_index(name='Compte')
-        y_val = 'Compte'
-    else:
-        df_agg = df.groupby([var_x] + ([var_color] if var_color else []))[var_y].mean().reset_index()
-        y_val = var_y
+def _aggregate(df, keys, var_y, how, engine=False):
+    """Agrégat d'un graphique : moteur analytique embarqué s'il est actif, sinon agrégation parallèle (ou pandas)"""
+    value, how = (None, 'count') if var_y == LABEL_COUNT else (var_y, how)
+    if engine:
+        df_agg = analytics.aggregate(keys, value, how)
+        if df_agg is not None: return df_agg
+    return aggregation.aggregate(df, keys, value, how)
+
+def _create_line_chart(df, var_x, var_y, var_color, palette, title, engine=False):
+    df_agg = _aggregate(df, [var_x] + ([var_color] if var_color else []), var_y, 'mean', engine)
+    y_val = 'Compte' if var_y == LABEL_COUNT else var_y
     return px.line(df_agg, x=var_x, y=y_val, color=var_color, markers=True, title=title, color_discrete_sequence=palette)
 
-def _create_area_chart(df, var_x, var_y, var_color, palette, title):
-    if var_y == LABEL_COUNT:
-        df_agg = df.groupby([var_x] + ([var_color] if var_color else [])).size().reset_index(name='Compte')
-        y_val = 'Compte'
-    else:
-        df_agg = df.groupby([var_x] + ([var_color] if var_color else []))[var_y].sum().reset_index()
-        y_val = var_y
+def _create_area_chart(df, var_x, var_y, var_color, palette, title, engine=False):
+    df_agg = _aggregate(df, [var_x] + ([var_color] if var_color else []), var_y, 'sum', engine)
+    y_val = 'Compte' if var_y == LABEL_COUNT else var_y
     return px.area(df_agg, x=var_x, y=y_val, color=var_color, title=title, color_discrete_sequence=palette)
 
-def get_custom_figure(df, chart_type, var_x, var_y, var_color, palette, title): # pragma: no cover
+def get_custom_figure(df, chart_type, var_x, var_y, var_color, palette, title, engine=False): # pragma: no cover
     """Helper pour créer le graphique"""
     if var_y == LABEL_COUNT:
         if chart_type == "Boîte à moustache":
@@ -271,18 +374,26 @@ def get_custom_figure(df, chart_type, var_x, var_y, var_color, palette, title):
             return None
 
     if chart_type == "Barres":
-        return _create_bar_chart(df, var_x, var_y, var_color, palette, title)
+        return _create_bar_chart(df, var_x, var_y, var_color, palette, title, engine)
     if chart_type == "Lignes":
-        return _create_line_chart(df, var_x, var_y, var_color, palette, title)
+        return _create_line_chart(df, var_x, var_y, var_color, palette, title, engine)
     if chart_type == "Aires":
-        return _create_area_chart(df, var_x, var_y, var_color, palette, title)
+        return _create_area_chart(df, var_x, var_y, var_color, palette, title, engine)
     
     # Cas simples restants
     if chart_type == "Camembert":
-        return px.pie(df, names=var_x, title=title, color_discrete_sequence=palette, hole=0.4)
+        return charts.pie_chart(df, var_x, title=title, palette=palette, hole=0.4)
     if chart_type == "Boîte à moustache":
+        # Quartiles calculés par le moteur embarqué : seules les statistiques sont tracées
+        stats = analytics.quantiles(var_y, by=[var_x] + ([var_color] if var_color else [])) if engine else None
+        if stats is None and charts.is_large(df):
+            stats = charts.quantile_summary(df, var_y, [var_x] + ([var_color] if var_color else []))
+        if stats is not None:
+            return charts.box_from_quantiles(stats, var_x, var_y, var_color, palette, title)
         return px.box(df, x=var_x, y=var_y, color=var_color, title=title, color_discrete_sequence=palette)
     if chart_type == "Nuage de points":
+        if charts.is_large(df):
+            return charts.scatter_gl(df, var_x, var_y, var_color, palette, title)
         return px.scatter(df, x=var_x, y=var_y, color=var_color, title=title, color_discrete_sequence=palette)
     return None
 
@@ -300,22 +411,122 @@ def render_chart_creator(df, palette): # pragma: no cover
         chart_types = ["Barres", "Lignes", "Aires", "Camembert", "Boîte à moustache", "Nuage de points"]
         chart_type = c4.selectbox("4. Type de Graphique", options=chart_types)
 
+    # Copie analytique locale rattrapée par incrément (None : duckdb absent ou erreur)
+    engine = analytics.sync() is not None
+    if engine:
+        st.caption("Agrégats calculés par le moteur analytique embarqué (DuckDB).")
+
     st.divider()
     try:
         title_text = f"Analyse : {var_x}"
         if var_y != LABEL_COUNT: title_text += f" vs {var_y}"
         if var_color: title_text += f" (par {var_color})"
 
-        fig_custom = get_custom_figure(df, chart_type, var_x, var_y, var_color, palette, title_text)
+        fig_custom = get_custom_figure(df, chart_type, var_x, var_y, var_color, palette, title_text, engine)
         
         if fig_custom:
             fig_custom.update_layout(height=500, plot_bgcolor="white")
             st.plotly_chart(fig_custom, use_container_width=True)
             with st.expander("Voir les données"):
-                st.dataframe(df.head(50))
+                table = analytics.crosstab(var_x, var_color) if engine and var_color else None
+                st.dataframe(table if table is not None else df.head(50))
     except Exception as e:
         st.error(f"Erreur graphique : {e}")
 
+    render_export(df)
+
+def render_export(df): # pragma: no cover
+    """Export complet (CSV / Excel) produit en flux côté serveur"""
+    with st.expander("📥 Exporter les données"):
+        c1, c2, c3 = st.columns(3)
+        fmt = c1.radio("Format", ["csv", "xlsx"], horizontal=True)
+        with_dem = c2.checkbox("Inclure les demandes")
+        with_sol = c2.checkbox("Inclure les solutions")
+        periode = c3.date_input("Période (optionnelle)", value=[])
+        communes = st.multiselect("Communes (optionnel)", sorted(df["commune"].dropna().unique()) if "commune" in df.columns else [])
+
+        if st.button("Préparer l'export"):
+            filters = {'commune': communes}
+            if len(periode) == 2:
+                filters['date_debut'], filters['date_fin'] = periode
+            # Fichier construit sur disque par paquets (pas de DataFrame complet en mémoire),
+            # puis lu une seule fois pour le bouton de téléchargement et supprimé aussitôt
+            with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as tmp:
+                path = tmp.name
+            try:
+                with st.spinner("Export en cours..."):
+                    nb = export_entretiens(path, fmt, filters, with_dem, with_sol)
+                content = None
+                if nb is not None:
+                    with open(path, "rb") as f:
+                        content = f.read()
+            finally:
+                os.unlink(path)
+            if nb is None:
+                st.error("❌ Erreur lors de l'export.")
+            else:
+                st.success(f"{nb} entretiens exportés.")
+                st.download_button("Télécharger", content, file_name=f"entretiens_{date.today()}.{fmt}")
+
+def page_consultation(): # pragma: no cover
+    """Navigateur d'entretiens : une seule page lue en base par affichage"""
+    st.title("Consultation des entretiens")
+
+    c1, c2, c3, c4 = st.columns(4)
+    commune = c1.text_input("Commune (exacte)")
+    periode = c2.date_input("Période", value=[])
+    ordre = c3.radio("Ordre", ["Plus récents", "Plus anciens"], horizontal=True)
+    taille = c4.selectbox("Lignes par page", [25, 50, 100], index=1)
+    filters = {'commune': commune.strip()}
+    if len(periode) == 2:
+        filters['date_debut'], filters['date_fin'] = periode
+    descending = ordre == "Plus récents"
+
+    # Toute modification des critères ramène à la première page
+    criteres = (commune, tuple(periode), ordre, taille)
+    if st.session_state.get("browse_criteres") != criteres:
+        st.session_state.browse_criteres = criteres
+        st.session_state.browse_pos = {}
+
+    aller = st.number_input("Aller au N°", min_value=0, value=0, step=1, help="0 = début de liste")
+    if st.button("Aller"):
+        st.session_state.browse_pos = {'after': aller + (1 if descending else -1)} if aller else {}
+
+    page = get_entretiens_page(limit=taille, descending=descending, filters=filters, **st.session_state.browse_pos)
+    if page['error']:
+        st.error("❌ Lecture des entretiens impossible.")
+        return
+    if page['rows'].empty:
+        st.info("Aucun entretien pour ces critères.")
+        return
+    st.dataframe(page['rows'], use_container_width=True, hide_index=True)
+
+    nav_prev, nav_info, nav_next = st.columns([1, 2, 1])
+    if nav_prev.button("⬅️ Précédent", disabled=not page['has_prev']):
+        st.session_state.browse_pos = {'before': page['first']}
+        st.rerun()
+    nav_info.markdown(f"<div style='text-align:center'>N° {page['first']} à {page['last']}</div>", unsafe_allow_html=True)
+    if nav_next.button("Suivant ➡️", disabled=not page['has_next']):
+        st.session_state.browse_pos = {'after': page['last']}
+        st.rerun()
+
+    render_audit()
+
+def render_audit(): # pragma: no cover
+    """Contrôle de toute la table entretien contre les règles du questionnaire"""
+    with st.expander("🔎 Contrôle qualité des données"):
+        if not st.button("Lancer le contrôle"):
+            return
+        violations = audit_entretiens()
+        if violations is None:
+            st.error("❌ Contrôle impossible (erreur BDD).")
+        elif violations.empty:
+            st.success("✅ Aucune anomalie : toutes les valeurs respectent le questionnaire.")
+        else:
+            st.warning(f"{len(violations)} anomalies sur {violations['num'].nunique()} entretiens.")
+            st.dataframe(summarize_violations(violations), hide_index=True)
+            st.dataframe(violations.drop(columns=['ligne']), hide_index=True, use_container_width=True)
+
 def page_configuration(): # pragma: no cover
     st.title("Gestion de la Structure")
     st.info("Suivez les étapes ci-dessous pour modifier le formulaire.")
@@ -507,11 +718,20 @@ def handle_existing_rubrique(rub_id, rub_lib): # pragma: no cover
 #  POINT D'ENTRÉE PRINCIPAL (MAIN)
 # =================================================================
 
+@st.cache_resource
+def init_schema(): # pragma: no cover
+    """Mises à jour du schéma, partitions à venir, rattachement des communes et cube géographique, une fois par processus
+    (seules les mises à jour manquantes sont jouées, voir SCHEMA_UPGRADES)"""
+    return ensure_schema() and ensure_partitions() and resolve_communes_history() is not None and rebuild_geo_cube()
+
 def main():  # pragma: no cover
     if connection is None:
         st.error("❌ Erreur de connexion BDD. Vérifiez backend.py")
         st.stop()
 
+    if not init_schema():
+        # Échec (verrou non obtenu, BDD indisponible) : nouvel essai au prochain rechargement
+        init_schema.clear()
     col_navy, col_gold, palette = load_css()
     menu_selection = show_sidebar(col_navy)
 
@@ -519,6 +739,8 @@ def main():  # pragma: no cover
         page_alimentation(col_navy)
     elif menu_selection == "VISUALISATION":
         page_visualisation(col_navy, col_gold, palette)
+    elif menu_selection == "CONSULTATION":
+        page_consultation()
     elif menu_selection == "CONFIGURATION":
         page_configuration()
 
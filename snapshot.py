@@ -0,0 +1,59 @@
+# =================================================================
+#  STOCKAGE LOCAL DES RÉSULTATS PRÉCALCULÉS
+# =================================================================
+# Le worker (worker.py) écrit, les pages lisent. L'écriture passe par un
+# fichier temporaire renommé : un lecteur voit l'ancienne ou la nouvelle
+# version, jamais un fichier à moitié écrit.
+
+import os
+import pickle
+import tempfile
+import time
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshots"))
+# Au-delà, le précalcul est jugé périmé (worker arrêté) et les pages calculent en direct
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", "900"))
+
+REPORTING = "reporting"
+
+
+def _path(name, directory=None):
+    return os.path.join(directory or SNAPSHOT_DIR, f"{name}.pkl")
+
+
+def publish(name, payload, directory=None):
+    directory = directory or SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    payload = dict(payload, generated_at=time.time())
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _path(name, directory))
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def snapshot_mtime(name, directory=None):
+    """Date de dernière publication (clé de cache côté pages), None si absente"""
+    try:
+        return os.path.getmtime(_path(name, directory))
+    except OSError:
+        return None
+
+
+def is_fresh(payload, max_age=SNAPSHOT_MAX_AGE):
+    return payload is not None and time.time() - payload.get('generated_at', 0) <= max_age
+
+
+def read(name, directory=None, max_age=SNAPSHOT_MAX_AGE):
+    """Dernier précalcul publié, ou None s'il est absent, illisible ou périmé (max_age=None : pas de limite)"""
+    try:
+        with open(_path(name, directory), "rb") as f:
+            payload = pickle.load(f)
+    except Exception:
+        return None
+    if max_age is not None and not is_fresh(payload, max_age):
+        return None
+    return payload
@@ -0,0 +1,182 @@
+"""
+Test de charge : N conseillers qui saisissent des entretiens et M analystes
+qui consultent le tableau de bord, en parallèle, contre une base PostgreSQL
+locale (appels directs à la couche backend).
+
+Chaque utilisateur virtuel est un processus distinct avec ses propres
+connexions, comme autant de postes clients.
+
+Usage (BASE DE TEST UNIQUEMENT : des entretiens sont réellement insérés) :
+    python test_charge.py --conseillers 10 --analystes 5 --duree 60 --nettoyage
+"""
+import argparse
+import multiprocessing
+import random
+import time
+
+
+# =================================================================
+#  MESURES
+# =================================================================
+
+def percentile(values, p):
+    """Percentile par rang le plus proche (values déjà triées)"""
+    if not values: return 0.0
+    rank = max(0, min(len(values) - 1, int(round(p / 100 * len(values))) - 1))
+    return values[rank]
+
+
+def summarize(records, duration):
+    """records = [(operation, latence_ms, ok)] -> statistiques par opération"""
+    stats = {}
+    for operation in sorted({r[0] for r in records}):
+        latencies = sorted(r[1] for r in records if r[0] == operation)
+        errors = sum(1 for r in records if r[0] == operation and not r[2])
+        stats[operation] = {
+            'nb': len(latencies),
+            'debit': len(latencies) / duration if duration else 0.0,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'erreurs': errors / len(latencies),
+        }
+    return stats
+
+
+def _timed(records, operation, func):
+    start = time.perf_counter()
+    try:
+        ok = func()
+    except Exception:
+        ok = False
+    records.append((operation, (time.perf_counter() - start) * 1000, bool(ok)))
+
+
+# =================================================================
+#  UTILISATEURS VIRTUELS
+# =================================================================
+
+def build_random_entretien(structure, rng):
+    """Entretien plausible d'après la structure du questionnaire"""
+    data = {}
+    for variables in structure.values():
+        for var in variables:
+            options = var['options']
+            if var['type'] == 'MOD' and options:
+                data[var['lib'].lower()] = rng.choice(list(options.values()))
+            elif var['type'] == 'NUM':
+                data[var['lib'].lower()] = rng.randint(options.get('min') or 0, options.get('max') or 10)
+            elif var['type'] == 'CHAINE':
+                data[var['lib'].lower()] = rng.choice(options) if options else None
+    return data
+
+
+def conseiller(duration, seed, queue):  # pragma: no cover
+    import backend
+    rng = random.Random(seed)
+    records, inserted = [], []
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        form = {}
+
+        def ouverture():
+            form['structure'] = backend.get_questionnaire_structure()
+            form['dem'], form['sol'] = backend.get_demande_solution_modalites()
+            return bool(form['structure'])
+
+        def enregistrement():
+            num = backend.insert_full_entretien(build_random_entretien(form.get('structure', {}), rng))
+            if not num: return False
+            inserted.append(num)
+            backend.insert_demandes(num, rng.sample(list(form['dem'].values()), min(2, len(form['dem']))))
+            backend.insert_solutions(num, rng.sample(list(form['sol'].values()), min(1, len(form['sol']))))
+            return True
+
+        _timed(records, "ouverture_formulaire", ouverture)
+        _timed(records, "enregistrement", enregistrement)
+        # Temps de saisie d'un conseiller entre deux enregistrements
+        time.sleep(rng.uniform(0.05, 0.2))
+    queue.put((records, inserted))
+
+
+def analyste(duration, seed, queue):  # pragma: no cover
+    import backend
+    import charts
+    rng = random.Random(seed)
+    records = []
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        def tableau_de_bord():
+            df = backend.get_data_for_reporting()
+            charts.compute_kpis(df)
+            charts.build_global_figures(df)
+            return not df.empty
+
+        _timed(records, "tableau_de_bord", tableau_de_bord)
+        _timed(records, "vue_territoriale", lambda: not backend.get_geo_rollup('AGGLO').empty)
+        _timed(records, "consultation",
+               lambda: not backend.get_entretiens_page(after=rng.randint(0, 1000), limit=50)['error'])
+        time.sleep(rng.uniform(0.2, 0.5))
+    queue.put((records, []))
+
+
+# =================================================================
+#  ORCHESTRATION
+# =================================================================
+
+def run(nb_conseillers, nb_analystes, duration):  # pragma: no cover
+    queue = multiprocessing.Queue()
+    users = [multiprocessing.Process(target=conseiller, args=(duration, i, queue)) for i in range(nb_conseillers)]
+    users += [multiprocessing.Process(target=analyste, args=(duration, 1000 + i, queue)) for i in range(nb_analystes)]
+    start = time.time()
+    for p in users: p.start()
+
+    records, inserted = [], []
+    for _ in users:
+        user_records, user_inserted = queue.get()
+        records.extend(user_records)
+        inserted.extend(user_inserted)
+    for p in users: p.join()
+    return records, inserted, time.time() - start
+
+
+def cleanup(nums):  # pragma: no cover
+    """Supprime les entretiens insérés par le test puis recalcule le cube géographique"""
+    import backend
+    if not nums or backend.connection is None: return
+    cursor = backend.connection.cursor()
+    try:
+        for table in ("demande", "solution", "entretien"):
+            cursor.execute(f"DELETE FROM {table} WHERE num = ANY(%s)", (nums,))
+        backend.connection.commit()
+    finally:
+        cursor.close()
+    backend.rebuild_geo_cube()
+
+
+def print_report(stats, duration):  # pragma: no cover
+    print(f"\n=== Résultats sur {duration:.0f} s ===")
+    print(f"{'Opération':<22}{'Nb':>7}{'Débit/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'Erreurs':>10}")
+    for operation, s in stats.items():
+        print(f"{operation:<22}{s['nb']:>7}{s['debit']:>10.1f}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}{s['erreurs']:>9.1%}")
+
+
+def main():  # pragma: no cover
+    parser = argparse.ArgumentParser(description="Test de charge conseillers / analystes")
+    parser.add_argument("--conseillers", type=int, default=5)
+    parser.add_argument("--analystes", type=int, default=2)
+    parser.add_argument("--duree", type=int, default=30, help="Durée en secondes")
+    parser.add_argument("--nettoyage", action="store_true", help="Supprime les entretiens créés à la fin")
+    args = parser.parse_args()
+
+    print(f"Lancement : {args.conseillers} conseillers, {args.analystes} analystes, {args.duree} s...")
+    records, inserted, duration = run(args.conseillers, args.analystes, args.duree)
+    print_report(summarize(records, duration), duration)
+    print(f"\n{len(inserted)} entretiens insérés.")
+    if args.nettoyage:
+        cleanup(inserted)
+        print("Entretiens de test supprimés.")
+
+
+if __name__ == "__main__":
+    main()
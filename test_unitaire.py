@@ -1,8 +1,28 @@
 import pytest
 from unittest.mock import MagicMock, patch
-from datetime import date
+from datetime import date, datetime, timezone
+import numpy as np
 import pandas as pd
 import backend  # On importe le module backend
+import geo
+import export
+import dtype_plan
+import charts
+import snapshot
+import worker
+import test_charge
+import validation
+import autocomplete
+import aggregation
+import analytics
+import partitions
+
+@pytest.fixture(autouse=True)
+def no_reporting_connection():
+    """Les lectures de reporting retombent sur backend.connection (celle que les tests simulent),
+    même si un réplica local était joignable à l'import"""
+    with patch('backend.reporting_connection', None):
+        yield
 
 # =================================================================
 #  TESTS INITIALISATION & CONNEXION (Pour couvrir le haut du fichier)
@@ -19,6 +39,28 @@ def test_init_connection_fail(mock_connect):
     conn = backend.init_connection()
     assert conn is None
 
+@patch('psycopg2.connect')
+def test_init_reporting_connection(mock_connect):
+    """La connexion de reporting est en lecture seule, autocommit, avec timeout"""
+    conn = backend.init_reporting_connection()
+    assert conn is mock_connect.return_value
+    conn.set_session.assert_called_once_with(readonly=True, autocommit=True)
+    assert "statement_timeout" in mock_connect.call_args[1]['options']
+
+    mock_connect.side_effect = Exception("Réplica injoignable")
+    assert backend.init_reporting_connection() is None
+
+def test_reporting_routing():
+    """Les lectures de reporting vont sur la connexion dédiée, sinon sur la principale"""
+    primary, replica = MagicMock(), MagicMock()
+    replica.cursor.return_value.fetchall.side_effect = [[{'sexe': '1'}], [], []]
+    with patch('backend.connection', primary), patch('backend.reporting_connection', replica):
+        assert backend.get_reporting_connection() is replica
+        assert not backend.get_data_for_reporting().empty
+        primary.cursor.assert_not_called()
+    with patch('backend.connection', primary), patch('backend.reporting_connection', None):
+        assert backend.get_reporting_connection() is primary
+
 # =================================================================
 #  TESTS CAS NOMINAUX
 # =================================================================
@@ -37,9 +79,24 @@ def test_save_configuration_insert(mock_conn):
     """Test INSERT configuration"""
     mock_cursor = MagicMock()
     mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchall.return_value = []
     result = backend.save_configuration('ENTRETIEN', True, 2, "New", "MOD", 1, "Com", ["A", "B"])
     assert result is True
-    assert "INSERT INTO variable" in mock_cursor.execute.call_args_list[0][0][0]
+    sql, params = mock_cursor.execute.call_args_list[0][0]
+    assert "INSERT INTO variable" in sql and "MAX(pos_r)" in sql and params[1] == 1
+    # Codes numérotés comme les modalités d'origine (colonne code sur 2 caractères)
+    assert mock_cursor.executemany.call_args[0][1] == [('ENTRETIEN', 2, 1, 'A', '1'), ('ENTRETIEN', 2, 2, 'B', '2')]
+
+@patch('backend.connection')
+def test_save_configuration_keeps_codes(mock_conn):
+    """Modalités réordonnées / ajoutées : chaque libellé existant garde son code, les nouveaux prennent le suivant"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchall.return_value = [('A', '1'), ('B', '2'), ('C', '3')]
+    assert backend.save_configuration('ENTRETIEN', False, 2, "Var", "MOD", 1, "Com", ["C", "D", "A"]) is True
+    assert mock_cursor.executemany.call_args[0][1] == [('ENTRETIEN', 2, 1, 'C', '3'), ('ENTRETIEN', 2, 2, 'D', '4'),
+                                                       ('ENTRETIEN', 2, 3, 'A', '1')]
+    assert backend.assign_modalite_codes({'X': 'AB', 'Y': '7'}, ['Z', 'X']) == ['8', 'AB']
 
 @patch('backend.connection')
 def test_get_questionnaire_structure(mock_conn):
@@ -64,8 +121,9 @@ def test_get_demande_solution_modalites(mock_conn):
     d, s = backend.get_demande_solution_modalites()
     assert 'A' in d and 'B' in s
 
+@patch('backend.execute_batch')
 @patch('backend.connection')
-def test_insert_full_entretien_success(mock_conn):
+def test_insert_full_entretien_success(mock_conn, mock_batch):
     """Test insertion succès"""
     mock_cursor = MagicMock()
     mock_cursor.fetchone.side_effect = [[98], [99]] 
@@ -74,15 +132,39 @@ def test_insert_full_entretien_success(mock_conn):
             "enfant": 0, "modele_fam": None, "profession": 3, "ress": 2, 
             "origine": 1, "commune": "Nantes", "partenaire": None}
     assert backend.insert_full_entretien(data) == 99
+    # Cube géographique mis à jour dans la même transaction
+    mock_batch.assert_called_once()
 
+@patch('backend.execute_batch')
 @patch('backend.connection')
-def test_insert_demandes_solutions(mock_conn):
-    """Test insertion demandes et solutions"""
+def test_insert_demandes_solutions(mock_conn, mock_batch):
+    """Test insertion demandes et solutions (un seul aller-retour par liste)"""
     mock_cursor = MagicMock()
     mock_conn.cursor.return_value = mock_cursor
-    backend.insert_demandes(10, ['A'])
+    backend.insert_demandes(10, ['A', 'C'])
     backend.insert_solutions(10, ['B'])
-    assert mock_cursor.executemany.call_count == 2
+    assert mock_batch.call_count == 2
+    assert mock_batch.call_args_list[0][0][1] == "EXECUTE insert_demande (%s, %s, %s)"
+    assert mock_batch.call_args_list[0][0][2] == [(10, 1, 'A'), (10, 2, 'C')]
+
+@patch('backend.execute_batch')
+def test_prepared_statements_once_per_connection(mock_batch):
+    """Chaque requête n'est préparée qu'une fois par connexion"""
+    conn_a, conn_b = MagicMock(), MagicMock()
+    cursor = MagicMock()
+    backend.execute_prepared(conn_a, cursor, 'modalites_variable', ('ENTRETIEN', 3))
+    backend.execute_prepared(conn_a, cursor, 'modalites_variable', ('ENTRETIEN', 5))
+    prepares = [c for c in cursor.execute.call_args_list if c[0][0].startswith("PREPARE")]
+    assert len(prepares) == 1
+    assert cursor.execute.call_args[0] == ("EXECUTE modalites_variable (%s, %s)", ('ENTRETIEN', 5))
+
+    # Nouvelle connexion (pool, reconnexion) -> nouvelle préparation
+    backend.execute_prepared(conn_b, cursor, 'next_num_entretien')
+    assert cursor.execute.call_args_list[-2][0][0].startswith("PREPARE next_num_entretien")
+    assert cursor.execute.call_args[0] == ("EXECUTE next_num_entretien", ())
+
+    backend.execute_prepared_batch(conn_b, cursor, 'insert_demande', [])
+    mock_batch.assert_not_called()
 
 @patch('backend.connection')
 def test_upsert_rubrique_cases(mock_conn):
@@ -131,6 +213,732 @@ def test_get_data_for_reporting_complex(mock_conn):
     assert df.iloc[0]['ville'] == 'Paris'
     # 'inconnu' n'est pas dans vars_map -> doit rester 'X'
     assert df.iloc[0]['inconnu'] == 'X'
+    # Types compacts appliqués et empreinte mémoire mesurée
+    assert 'memoire' in df.attrs
+
+def test_split_attributes():
+    """Seules les variables sans colonne physique (et renseignées) partent dans attributs"""
+    data = {'num': None, 'date_ent': None, 'sexe': '1', 'commune': 'Vannes',
+            'logement': '2', 'nb_visites': 3, 'association': '', 'autre': None}
+    assert backend.split_attributes(data) == {'logement': '2', 'nb_visites': 3}
+
+def test_expand_attributes():
+    """Une colonne par variable déclarée, typée d'après type_v ; la colonne jsonb disparaît"""
+    df = pd.DataFrame({'num': [1, 2, 3], 'sexe': ['1', '2', '1'],
+                       'attributs': [{'logement': '2', 'nb_visites': '3'}, {}, {'nb_visites': 'x', 'ancienne': 'Z'}]})
+    var_types = {'sexe': {'type': 'MOD'}, 'logement': {'type': 'MOD'}, 'nb_visites': {'type': 'NUM'},
+                 'association': {'type': 'CHAINE'}}
+    out = backend.expand_attributes(df, var_types)
+    assert 'attributs' not in out.columns and 'ancienne' not in out.columns
+    assert out['logement'].iloc[0] == '2' and out['logement'].iloc[1:].isna().all()
+    assert out['nb_visites'].iloc[0] == 3 and out['nb_visites'].isna().sum() == 2
+    assert out['association'].isna().all()
+    # Sans colonne attributs (base non migrée) : rien ne change
+    plain = pd.DataFrame({'num': [1]})
+    assert backend.expand_attributes(plain, var_types) is plain
+
+@patch('backend.execute_batch')
+@patch('backend.connection')
+def test_insert_full_entretien_attributes(mock_conn, mock_batch):
+    """Les variables ajoutées en configuration sont écrites dans le même INSERT (paramètre jsonb)"""
+    mock_cursor = MagicMock()
+    mock_cursor.fetchone.side_effect = [[98], [99]]
+    mock_conn.cursor.return_value = mock_cursor
+    with patch('backend._geo_reference', REF_GEO):
+        assert backend.insert_full_entretien({'sexe': 1, 'logement': '2', 'num': None}) == 99
+    insert_params = [c[0][1] for c in mock_cursor.execute.call_args_list if c[0][0].startswith("EXECUTE insert_entretien")][0]
+    assert insert_params[-1].adapted == {'logement': '2'}
+
+# =================================================================
+#  TESTS CUBE GÉOGRAPHIQUE
+# =================================================================
+
+REF_GEO = geo.build_geo_reference(
+    [{'code_a': 1, 'nom_a': 'GMVA'}],
+    [{'code_c': 10, 'nom_c': 'Vannes', 'code_a': 1}, {'code_c': 20, 'nom_c': 'Pontivy', 'code_a': None}],
+    [{'code_q': 100, 'nom_q': 'Kercado', 'code_c': 10}]
+)
+
+def _full_catalog():
+    """Catalogue d'un schéma déjà à jour"""
+    catalog = {'table': {'entretien': 'r'}, 'column': set(), 'default': set(), 'index': {}, 'function': set(), 'trigger': set()}
+    for kind, table, name, _ in backend.SCHEMA_UPGRADES:
+        if kind == 'table': catalog['table'][name] = 'r'
+        elif kind == 'index': catalog['index'][name] = True
+        elif kind == 'function': catalog['function'].add(name)
+        else: catalog[kind].add((table, name))
+    return catalog
+
+def test_missing_upgrades():
+    """Seuls les objets absents (ou index invalides) sont à créer"""
+    catalog = _full_catalog()
+    assert backend.missing_upgrades(catalog) == []
+    catalog['index']['entretien_commune_idx'] = False
+    catalog['column'].discard(('entretien', 'attributs'))
+    assert [u[2] for u in backend.missing_upgrades(catalog)] == ['entretien_commune_idx', 'attributs']
+
+@patch('backend.connection')
+def test_ensure_schema(mock_conn):
+    """Schéma à jour : aucun ordre DDL ; sinon colonnes en transaction puis index CONCURRENTLY"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    with patch('backend.read_schema_catalog', return_value=_full_catalog()):
+        assert backend.ensure_schema() is True
+    assert mock_cursor.execute.call_count == 0
+
+    empty = {'table': {'entretien': 'r'}, 'column': set(), 'default': set(), 'index': {}, 'function': set(), 'trigger': set()}
+    with patch('backend.read_schema_catalog', return_value=empty):
+        assert backend.ensure_schema() is True
+    sql = [c[0][0] for c in mock_cursor.execute.call_args_list]
+    assert sql[0].startswith("SET LOCAL lock_timeout") and len(sql) == len(backend.SCHEMA_UPGRADES) + 1
+    assert all("CONCURRENTLY" in q for q in sql if q.startswith("CREATE INDEX"))
+    assert mock_conn.autocommit is False
+
+    # Table partitionnée : index construit dans la transaction, sans CONCURRENTLY
+    mock_cursor.reset_mock()
+    with patch('backend.read_schema_catalog', return_value={**empty, 'table': {'entretien': 'p'}}):
+        assert backend.ensure_schema() is True
+    assert not any("CONCURRENTLY" in c[0][0] for c in mock_cursor.execute.call_args_list)
+
+def test_geo_resolve_and_rollup():
+    """Résolution texte libre -> codes et agrégation sur les trois niveaux"""
+    assert geo.resolve_commune("  vannes ", REF_GEO) == (10, None)
+    assert geo.resolve_commune("KERCADO", REF_GEO) == (10, 100)
+    assert geo.resolve_commune("Paris", REF_GEO) == (None, None)
+    assert geo.resolve_commune(None, REF_GEO) == (None, None)
+
+    cube = geo.rollup_counts({(10, None): 3, (10, 100): 2, (20, None): 1, (None, None): 4}, REF_GEO)
+    assert cube[('AGGLO', 1)] == 5
+    assert cube[('COMMUNE', 10)] == 5
+    assert cube[('QUARTIER', 100)] == 2
+    # Commune hors agglo et texte inconnu -> code 0
+    assert cube[('AGGLO', 0)] == 5
+    assert cube[('COMMUNE', 0)] == 4
+
+def test_geo_normalisation_and_fuzzy():
+    """Accents, abréviations, initiale de quartier et fautes de frappe bornées"""
+    ref = geo.build_geo_reference(
+        [],
+        [{'code_c': 10, 'nom_c': 'Vannes', 'code_a': 1}, {'code_c': 30, 'nom_c': 'St-Avé', 'code_a': 1}],
+        [{'code_q': 100, 'nom_q': 'Vannes Kercado', 'code_c': 10},
+         {'code_q': 101, 'nom_q': 'Vannes Ménimur', 'code_c': 10},
+         {'code_q': 102, 'nom_q': 'Vannes Menez', 'code_c': 10}]
+    )
+    assert geo.normalize_name("  St-Avé ") == "saint ave"
+    assert geo.resolve_commune("Saint Ave", ref) == (30, None)
+    assert geo.resolve_commune("Vannes k", ref) == (10, 100)
+    # Initiale ambiguë (Ménimur / Menez) : pas d'alias, on retombe sur la commune par approximation
+    assert geo.resolve_commune("Vannes M", ref) == (10, None)
+    assert geo.resolve_commune("Vanes", ref) == (10, None)
+    assert geo.resolve_commune("Vanes", ref, fuzzy=False) == (None, None)
+    assert geo.resolve_commune("Lorient", ref) == (None, None)
+    assert geo.resolve_many(["Vannes", "VANNES", "Vannes"], ref) == {"Vannes": (10, None), "VANNES": (10, None)}
+
+@patch('backend.connection')
+def test_resolve_communes_history(mock_conn):
+    """Chaque texte distinct est résolu une fois ; les textes inconnus sont remontés"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchall.return_value = [('Vannes', 3), ('kercado', 2), ('Paris', 4)]
+    with patch('backend._geo_reference', REF_GEO), patch('backend.execute_batch') as mock_batch:
+        assert backend.resolve_communes_history() == {'Paris': 4}
+    rows = mock_batch.call_args[0][2]
+    assert (10, 100, 'kercado', 10, 100) in rows and len(rows) == 3
+    mock_conn.commit.assert_called_once()
+
+@patch('backend.connection')
+def test_rebuild_geo_cube(mock_conn):
+    """Recalcul complet : le cube est réécrit à partir des codes stockés"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchall.return_value = [(10, None, 3)]
+    with patch('backend._geo_reference', REF_GEO):
+        assert backend.rebuild_geo_cube() is True
+    rows = mock_cursor.executemany.call_args[0][1]
+    assert ('AGGLO', 1, 3) in rows and ('COMMUNE', 10, 3) in rows
+    executed = [c[0][0] for c in mock_cursor.execute.call_args_list]
+    assert executed.index("LOCK TABLE cube_geo IN EXCLUSIVE MODE") < next(i for i, sql in enumerate(executed) if "GROUP BY" in sql)
+
+@patch('backend.connection')
+def test_get_geo_rollup_with_parent(mock_conn):
+    """Lecture d'un niveau du cube filtré sur son parent"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchall.return_value = [{'code': 10, 'lib': 'Vannes', 'nb': 5}]
+    df = backend.get_geo_rollup('COMMUNE', 1)
+    assert df.iloc[0]['lib'] == 'Vannes'
+    query, params = mock_cursor.execute.call_args[0]
+    assert "code_a, 0) = %s" in query and params[-1] == 1
+    assert backend.get_geo_rollup('PAYS').empty
+
+# =================================================================
+#  TESTS CONSULTATION PAGINÉE
+# =================================================================
+
+@patch('backend.connection')
+def test_get_entretiens_page_keyset(mock_conn):
+    """Page suivante : WHERE num > dernier vu, LIMIT taille + 1, jamais d'OFFSET"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchall.side_effect = [
+        [{'num': 11, 'commune': 'Vannes'}, {'num': 12, 'commune': 'Vannes'}, {'num': 13, 'commune': 'Vannes'}],
+        [], []  # Métadonnées de décodage
+    ]
+    page = backend.get_entretiens_page(after=10, limit=2, filters={'commune': 'Vannes', 'date_fin': ''})
+    sql, params = mock_cursor.execute.call_args_list[0][0]
+    assert "commune = %s AND num > %s ORDER BY num ASC LIMIT %s" in sql
+    assert "OFFSET" not in sql and "date_ent" not in sql
+    assert params == ['Vannes', 10, 3]
+    assert list(page['rows']['num']) == [11, 12]
+    assert (page['first'], page['last'], page['has_prev'], page['has_next']) == (11, 12, True, True)
+    assert page['error'] is False
+
+@patch('backend.connection')
+def test_get_entretiens_page_backward_desc(mock_conn):
+    """Page précédente en ordre décroissant : lecture inversée puis remise dans l'ordre"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchall.side_effect = [[{'num': 21}, {'num': 22}], [], []]
+    page = backend.get_entretiens_page(before=20, limit=2, descending=True)
+    assert "num > %s ORDER BY num ASC" in mock_cursor.execute.call_args_list[0][0][0]
+    assert list(page['rows']['num']) == [22, 21]
+    assert page['has_next'] is True and page['has_prev'] is False
+
+# =================================================================
+#  TESTS EXPORT EN FLUX
+# =================================================================
+
+def test_build_export_query_filters():
+    """Seules les colonnes connues sont filtrables, les valeurs passent en paramètres"""
+    sql, params = export.build_export_query(
+        {'date_debut': date(2024, 1, 1), 'commune': ['Vannes'], 'inconnu; DROP TABLE x': ['1']},
+        with_demandes=True)
+    assert "AS demandes" in sql and "AS solutions" not in sql
+    assert "e.date_ent >= %s" in sql and "e.commune = ANY(%s)" in sql
+    assert "DROP" not in sql
+    assert params == [date(2024, 1, 1), ['Vannes']]
+    assert "d.date_ent" not in sql
+    # Tables partitionnées : la date de l'entretien limite la recherche des demandes à sa partition
+    sql, _ = export.build_export_query(with_demandes=True, with_solutions=True, partitioned=True)
+    assert "WHERE d.num = e.num AND (d.date_ent = e.date_ent OR e.date_ent IS NULL AND d.date_ent IS NULL)" in sql
+    assert "s.date_ent = e.date_ent" in sql
+
+def test_iter_export_chunks_and_csv():
+    """Lecture par paquets via un curseur nommé, décodage puis écriture CSV"""
+    import io
+    mock_conn = MagicMock()
+    meta_cursor, plain_cursor, stream_cursor = MagicMock(), MagicMock(), MagicMock()
+    mock_conn.cursor.side_effect = [meta_cursor, plain_cursor, stream_cursor]
+    plain_cursor.fetchone.return_value = (False,)
+    meta_cursor.fetchall.side_effect = [[{'pos': 5, 'lib': 'SEXE'}], [{'pos': 5, 'code': '1', 'lib_m': 'Homme'}]]
+    stream_cursor.fetchmany.side_effect = [[{'num': 1, 'sexe': 1}, {'num': 2, 'sexe': 2}], [{'num': 3, 'sexe': 1}], []]
+
+    out = io.StringIO()
+    assert export.write_csv(export.iter_export_chunks(mock_conn, chunk_size=2), out) == 3
+    assert mock_conn.cursor.call_args_list[2][1]['name'] == 'export_entretiens'
+    assert out.getvalue().splitlines() == ['num;sexe', '1;Homme', '2;2', '3;Homme']
+
+@patch('export.backend.init_reporting_connection')
+def test_export_entretiens_errors(mock_init, tmp_path):
+    """Connexion impossible ou erreur SQL : None, et la connexion est refermée"""
+    mock_init.return_value = None
+    assert export.export_entretiens(str(tmp_path / "a.csv")) is None
+
+    mock_conn = MagicMock()
+    mock_conn.cursor.return_value.execute.side_effect = Exception("Boom BDD")
+    mock_init.return_value = mock_conn
+    assert export.export_entretiens(str(tmp_path / "a.csv")) is None
+    mock_conn.close.assert_called_once()
+
+# =================================================================
+#  TESTS PLAN DE TYPES (REPORTING)
+# =================================================================
+
+def test_build_dtype_plan_from_metadata():
+    """MOD/CHAINE peu variés -> category, NUM borné -> Int8, DATE -> datetime, id -> entier étroit"""
+    df = pd.DataFrame({
+        'num': [1, 2, 3, 4],
+        'sexe': ['Homme', 'Femme', 'Homme', 'Homme'],
+        'enfant': [0, 2, None, 1],
+        'date_ent': [date(2024, 1, 1), None, date(2024, 2, 1), date(2024, 3, 1)],
+        'partenaire': ['A', 'B', 'C', 'D'],
+    })
+    var_types = {'sexe': {'type': 'MOD'}, 'enfant': {'type': 'NUM', 'min': 0, 'max': 13},
+                 'partenaire': {'type': 'CHAINE'}}
+    plan = dtype_plan.build_dtype_plan(df, var_types)
+    assert plan == {'num': 'Int8', 'sexe': 'category', 'enfant': 'Int8', 'date_ent': 'datetime64[ns]'}
+
+    df = dtype_plan.optimize_frame(df, var_types)
+    assert str(df['enfant'].dtype) == 'Int8' and df['enfant'].isna().sum() == 1
+    assert pd.api.types.is_datetime64_any_dtype(df['date_ent'])
+    assert df.attrs['memoire']['apres'] < df.attrs['memoire']['avant']
+
+def test_dtype_plan_bounds_and_bad_values():
+    """La plage élargit le type ; une valeur hors type laisse la colonne intacte"""
+    df = pd.DataFrame({'duree': [10, 20], 'age': ['12', 'NC']})
+    plan = dtype_plan.build_dtype_plan(df, {'duree': {'type': 'NUM', 'min': 0, 'max': 1000}})
+    assert plan['duree'] == 'Int16'
+    df = dtype_plan.apply_dtype_plan(df, {'age': 'Int8', 'duree': 'Int16'})
+    assert df['age'].isna().sum() == 1  # 'NC' devient manquant
+    assert list(dtype_plan.apply_dtype_plan(pd.DataFrame({'x': [300]}), {'x': 'Int8'})['x']) == [300]
+
+# =================================================================
+#  TESTS PRÉCALCUL (WORKER + STOCKAGE LOCAL)
+# =================================================================
+
+def test_snapshot_publish_read(tmp_path):
+    """Publication atomique puis relecture ; un précalcul trop ancien est ignoré"""
+    assert snapshot.read('x', directory=str(tmp_path)) is None
+    assert snapshot.snapshot_mtime('x', directory=str(tmp_path)) is None
+    snapshot.publish('x', {'kpis': {'total': 3}}, directory=str(tmp_path))
+    payload = snapshot.read('x', directory=str(tmp_path))
+    assert payload['kpis'] == {'total': 3} and snapshot.is_fresh(payload)
+    assert snapshot.snapshot_mtime('x', directory=str(tmp_path)) is not None
+
+    payload['generated_at'] -= 10_000
+    assert not snapshot.is_fresh(payload, max_age=60)
+    assert snapshot.read('x', directory=str(tmp_path), max_age=0) is None
+    assert list(tmp_path.iterdir()) == [tmp_path / 'x.pkl']  # Aucun fichier temporaire laissé
+
+def test_compute_kpis_and_figures():
+    """Indicateurs et graphiques de la vue globale, colonnes absentes tolérées"""
+    df = pd.DataFrame({'commune': ['Vannes', 'Vannes', 'Auray'], 'mode': ['Tel', 'RDV', 'RDV'], 'sexe': ['H', 'F', 'F']})
+    assert charts.compute_kpis(df) == {'total': 3, 'top_commune': 'Vannes', 'top_mode': 'RDV', 'top_age': 'N/A'}
+    figures = charts.build_global_figures(df)
+    assert figures['age'] is None and figures['sexe'] is not None
+    assert list(figures['commune'].data[0].y) == ['Vannes', 'Auray']
+
+@patch('worker.snapshot.publish')
+@patch('worker.backend.get_data_for_reporting')
+def test_worker_refresh(mock_data, mock_publish):
+    """Le worker publie le précalcul, sauf si la base ne renvoie rien"""
+    mock_data.return_value = pd.DataFrame()
+    assert worker.refresh() is False
+    mock_publish.assert_not_called()
+
+    mock_data.return_value = pd.DataFrame({'commune': ['Vannes'], 'mode': ['Tel'], 'age': ['26-40 ans']})
+    assert worker.refresh() is True
+    name, payload = mock_publish.call_args[0]
+    assert name == snapshot.REPORTING and payload['kpis']['total'] == 1
+    assert set(payload['figures']) == {'sexe', 'age', 'commune'}
+
+@patch('worker.time.sleep')
+@patch('worker.select.select')
+def test_worker_wait_for_change(mock_select, mock_sleep):
+    """Notification reçue -> True ; délai expiré ou pas de LISTEN -> False"""
+    assert worker.wait_for_change(None, 5) is False
+    mock_sleep.assert_called_with(5)
+
+    conn = MagicMock()
+    conn.notifies = ['maj']
+    mock_select.return_value = ([conn], [], [])
+    assert worker.wait_for_change(conn, 5) is True
+    assert conn.notifies == []
+
+    mock_select.return_value = ([], [], [])
+    assert worker.wait_for_change(conn, 5) is False
+
+@patch('worker.refresh')
+@patch('worker.wait_for_change')
+@patch('worker.listen_connection')
+def test_worker_run_iteration_reconnects(mock_listen, mock_wait, mock_refresh):
+    """Connexion LISTEN perdue : rouverte et précalcul immédiat ; partitions vérifiées une fois par jour"""
+    dead, fresh = MagicMock(closed=2), MagicMock(closed=0)
+    mock_listen.return_value = fresh
+    state = {}
+    with patch('worker.backend.reconnect') as mock_reconnect, \
+         patch('worker.backend.ensure_partitions', return_value=True) as mock_partitions:
+        assert worker.run_iteration(dead, state) is fresh
+        assert worker.run_iteration(fresh, state) is fresh
+    assert mock_reconnect.call_count == 2 and mock_listen.call_count == 1
+    assert mock_refresh.call_count == 3
+    mock_partitions.assert_called_once()
+
+def test_backend_reconnect():
+    """Seules les connexions fermées sont rouvertes"""
+    alive, closed = MagicMock(closed=0), MagicMock(closed=2)
+    with patch('backend.connection', alive), patch('backend.reporting_connection', closed), \
+         patch('backend.init_connection') as mock_init, patch('backend.init_reporting_connection') as mock_init_rep:
+        assert backend.reconnect() is True
+        mock_init.assert_not_called()
+        assert backend.reporting_connection is mock_init_rep.return_value
+
+@patch('backend.execute_batch')
+@patch('backend.connection')
+def test_insert_notifies_worker(mock_conn, mock_batch):
+    """La saisie émet un NOTIFY dans sa transaction, avant le commit"""
+    mock_cursor = MagicMock()
+    mock_cursor.fetchone.side_effect = [[1], [1]]
+    mock_conn.cursor.return_value = mock_cursor
+    backend.insert_full_entretien({'commune': 'Vannes'})
+    assert mock_cursor.execute.call_args_list[-1][0][0] == f"NOTIFY {backend.NOTIFY_CHANNEL}"
+    mock_conn.commit.assert_called_once()
+
+# =================================================================
+#  TESTS OUTILS DU TEST DE CHARGE
+# =================================================================
+
+def test_charge_summarize():
+    """Débit, percentiles et taux d'erreur par opération"""
+    records = [('enregistrement', float(ms), ms != 100) for ms in range(1, 101)] + [('consultation', 5.0, True)]
+    stats = test_charge.summarize(records, duration=10)
+    assert stats['enregistrement']['nb'] == 100 and stats['enregistrement']['debit'] == 10.0
+    assert (stats['enregistrement']['p50'], stats['enregistrement']['p95'], stats['enregistrement']['p99']) == (50.0, 95.0, 99.0)
+    assert stats['enregistrement']['erreurs'] == 0.01
+    assert stats['consultation']['p99'] == 5.0
+    assert test_charge.percentile([], 95) == 0.0
+
+def test_charge_random_entretien():
+    """Les valeurs générées respectent modalités, plages et listes"""
+    import random
+    structure = {'Usager': [
+        {'lib': 'SEXE', 'type': 'MOD', 'options': {'Homme': '1', 'Femme': '2'}},
+        {'lib': 'ENFANT', 'type': 'NUM', 'options': {'min': 0, 'max': 3}},
+        {'lib': 'COMMUNE', 'type': 'CHAINE', 'options': ['Vannes']},
+        {'lib': 'PARTENAIRE', 'type': 'CHAINE', 'options': []},
+    ]}
+    data = test_charge.build_random_entretien(structure, random.Random(1))
+    assert data['sexe'] in ('1', '2') and 0 <= data['enfant'] <= 3
+    assert data['commune'] == 'Vannes' and data['partenaire'] is None
+
+# =================================================================
+#  TESTS CONTRÔLE QUALITÉ
+# =================================================================
+
+RULES = validation.compile_rules(
+    [{'pos': 5, 'lib': 'SEXE', 'type_v': 'MOD'},
+     {'pos': 9, 'lib': 'ENFANT', 'type_v': 'NUM', 'est_contrainte': True},
+     {'pos': 14, 'lib': 'COMMUNE', 'type_v': 'CHAINE'},
+     {'pos': 1, 'lib': 'NUM', 'type_v': 'MOD'}],
+    [{'pos': 5, 'code': '1'}, {'pos': 5, 'code': '2'}],
+    [{'pos': 9, 'val_min': 0, 'val_max': 13}],
+    [{'pos': 14, 'lib': 'Vannes'}, {'pos': 14, 'lib': 'Auray'}],
+    required=['SEXE']
+)
+
+def test_validate_frame_rules():
+    """Obligatoire, code inconnu, plage, non numérique et liste contrôlés colonne par colonne"""
+    df = pd.DataFrame({
+        'num': [1, 2, 3, 4],
+        'sexe': [1.0, 3.0, None, 2.0],
+        'enfant': [0, 20, 'deux', None],
+        'commune': ['Vannes', ' Auray ', 'Paris', None],
+        'autre': ['x', 'y', 'z', 't'],
+    })
+    violations = validation.validate_frame(df, RULES)
+    found = set(zip(violations['num'], violations['colonne'], violations['regle']))
+    assert found == {
+        (2, 'sexe', 'code_inconnu'), (3, 'sexe', 'obligatoire'),
+        (2, 'enfant', 'hors_plage'), (3, 'enfant', 'non_numerique'),
+        (3, 'commune', 'hors_liste'),
+    }
+    # La variable MOD sans modalité (NUM) n'est pas contrôlée
+    assert 'num' not in set(violations['colonne'])
+    assert list(validation.valid_rows(df, violations)['num']) == [1, 4]
+    assert list(validation.valid_rows(df, violations, ['obligatoire'])['num']) == [1, 2, 4]
+    assert len(validation.summarize_violations(violations)) == 5
+    # est_contrainte (type de liste) ne rend pas la variable obligatoire : ENFANT vide accepté
+    assert (4, 'enfant', 'obligatoire') not in found
+
+def test_validate_frame_clean():
+    df = pd.DataFrame({'num': [1], 'sexe': ['2'], 'enfant': [3], 'commune': ['Vannes']})
+    violations = validation.validate_frame(df, RULES)
+    assert violations.empty and list(violations.columns) == validation.VIOLATION_COLUMNS
+
+@patch('backend.connection')
+def test_audit_entretiens(mock_conn):
+    """Audit complet : métadonnées puis toute la table en une passe"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchall.side_effect = [
+        [{'pos': 5, 'lib': 'SEXE', 'type_v': 'MOD'}],
+        [{'pos': 5, 'code': '1'}], [], [],
+        [{'num': 1, 'sexe': 1}, {'num': 2, 'sexe': 9}],
+    ]
+    violations = backend.audit_entretiens()
+    assert list(violations['num']) == [2]
+
+@patch('backend.connection')
+def test_insert_refused_on_blocking_violation(mock_conn):
+    """Code inconnu : rien n'est écrit ; une commune hors liste reste enregistrable"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    with patch('backend.get_cached_validation_rules', return_value=RULES):
+        assert backend.insert_full_entretien({'sexe': '9', 'commune': 'Vannes'}) is None
+        mock_conn.commit.assert_not_called()
+        assert list(backend.check_entretien({'sexe': '9'})['regle']) == ['code_inconnu']
+        assert backend.check_entretien({'sexe': '1', 'commune': 'Paris'}).empty
+
+# =================================================================
+#  TESTS AUTOCOMPLÉTION
+# =================================================================
+
+def test_autocomplete_prefix_index():
+    """Index trié insensible aux accents, à la casse et aux espaces"""
+    index = autocomplete.build_index(["Béganne", "Vannes", "Vannes Kercado", "Auray", "VANNES ", "nantes"])
+    assert autocomplete.fold_text("  Béganne  Ouest ") == "beganne ouest"
+    assert autocomplete.all_labels(index) == ["Auray", "Béganne", "nantes", "Vannes", "Vannes Kercado"]
+    # Saisie ramenée au libellé de référence, valeur inconnue simplement nettoyée
+    assert autocomplete.canonical(index, "  vannes ") == "Vannes"
+    assert autocomplete.canonical(index, " Nouvelle  commune ") == "Nouvelle commune"
+    assert autocomplete.canonical(index, "") is None
+    # Préfixe replié : plage bornée par dichotomie, limitée à limit libellés
+    assert autocomplete.complete(index, "bega") == ["Béganne"]
+    assert autocomplete.complete(index, "VAN") == ["Vannes", "Vannes Kercado"]
+    assert autocomplete.complete(index, "van", limit=1) == ["Vannes"]
+    assert autocomplete.complete(index, "x") == [] and autocomplete.complete(index, " ") == []
+
+@patch('backend.connection')
+def test_autocomplete_indexes_rebuilt_per_version(mock_conn):
+    """Index reconstruits uniquement quand la version de configuration change"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchone.return_value = {'version': 'v1'}
+    mock_cursor.fetchall.side_effect = [
+        [{'lib': 'COMMUNE', 'valeur': 'Vannes'}, {'lib': 'EXTRA', 'valeur': None}],
+        [{'valeur': 'VANNES'}, {'valeur': 'Auray'}],
+        # Variable ajoutée en configuration : réponses lues dans attributs
+        [{'valeur': 'Quiberon'}],
+    ]
+    cache = {'version': None, 'indexes': {}, 'checked': 0.0}
+    with patch('backend._autocomplete_cache', cache), patch('backend.get_reporting_connection') as mock_reporting:
+        indexes = backend.get_autocomplete_indexes()
+        # Connexion principale : jamais derrière une lecture de tableau de bord
+        mock_reporting.assert_not_called()
+        assert autocomplete.all_labels(indexes['commune']) == ['Auray', 'Vannes']
+        assert autocomplete.all_labels(indexes['extra']) == ['Quiberon']
+        # Dans le délai : pas même la lecture de version
+        assert backend.get_autocomplete_indexes() is indexes
+        assert mock_cursor.fetchone.call_count == 1
+        # Délai écoulé, même version : version relue, aucun rechargement
+        cache['checked'] = 0.0
+        assert backend.get_autocomplete_indexes() is indexes
+        assert mock_cursor.fetchone.call_count == 2 and mock_cursor.fetchall.call_count == 3
+
+# =================================================================
+#  TESTS PARTITIONNEMENT ANNUEL
+# =================================================================
+
+def test_partition_ddl():
+    """Une année = trois partitions liées par leurs clés étrangères ; archivage par DETACH"""
+    ddl = partitions.partition_ddl(2025)
+    assert "entretien_2025 PARTITION OF entretien (PRIMARY KEY (num)) FOR VALUES FROM ('2025-01-01') TO ('2026-01-01')" in ddl[0]
+    assert "REFERENCES entretien_2025 (num)" in ddl[1] and ddl[1].startswith("CREATE TABLE IF NOT EXISTS demande_2025")
+    assert partitions.partition_ddl()[0].endswith("DEFAULT")
+    assert partitions.detach_ddl(2019)[-1] == "ALTER TABLE entretien DETACH PARTITION entretien_2019"
+    assert partitions.years_ahead(date(2025, 12, 31)) == [2025, 2026]
+
+def test_partition_default_rows_ddl():
+    """Lignes de l'année mises de côté et retirées de la partition par défaut, puis réinsérées avec leurs demandes / solutions"""
+    before, after = partitions.default_rows_ddl(2026)
+    assert "FROM entretien_sans_date WHERE date_ent >= '2026-01-01' AND date_ent < '2027-01-01'" in before[0]
+    assert before[-1] == "DELETE FROM entretien_sans_date WHERE num IN (SELECT num FROM deplace_entretien)"
+    assert after[0] == "INSERT INTO entretien SELECT * FROM deplace_entretien"
+    assert "INSERT INTO solution SELECT * FROM deplace_solution" in after
+    assert after[-1] == "DROP TABLE deplace_entretien, deplace_demande, deplace_solution"
+
+def test_partition_migration_ddl():
+    """Bascule : partitions par défaut + années (sans doublon), clés étrangères reportées, anciennes tables supprimées"""
+    ddl = partitions.migration_ddl([2025, 2024, 2025], [('entretien_code_c_fkey', 'FOREIGN KEY (code_c) REFERENCES commune(code_c)')])
+    created = [d.split()[5] for d in ddl if d.startswith("CREATE TABLE IF NOT EXISTS entretien_")]
+    assert created == ['entretien_sans_date', 'entretien_2024', 'entretien_2025']
+    assert "ALTER TABLE entretien ADD CONSTRAINT entretien_code_c_fkey FOREIGN KEY (code_c) REFERENCES commune(code_c)" in ddl
+    assert ddl[-1] == "DROP TABLE demande_ancien, solution_ancien, entretien_ancien"
+
+@patch('backend.connection')
+def test_ensure_partitions(mock_conn):
+    """Tables partitionnées : création des partitions de l'année et de la suivante ; sinon aucun DDL"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchone.side_effect = [(True,), (False,), (False,)]
+    assert backend.ensure_partitions(date(2025, 6, 1)) is True
+    assert mock_cursor.execute.call_count == 1 + 2 * (1 + len(partitions.TABLES))
+
+    # Lignes de 2026 dans la partition par défaut : déplacées autour de la création de la partition
+    mock_cursor.reset_mock()
+    mock_cursor.fetchone.side_effect = [(True,), (False,), (True,)]
+    assert backend.ensure_partitions(date(2025, 6, 1)) is True
+    executed = [c[0][0] for c in mock_cursor.execute.call_args_list]
+    before, after = partitions.default_rows_ddl(2026)
+    assert executed[-len(before + partitions.partition_ddl(2026) + after):] == before + partitions.partition_ddl(2026) + after
+    mock_cursor.fetchone.side_effect = None
+
+    mock_cursor.reset_mock()
+    mock_cursor.fetchone.return_value = (False,)
+    assert backend.ensure_partitions() is True
+    assert mock_cursor.execute.call_count == 1
+
+@patch('backend.connection')
+def test_migrate_and_archive_partitions(mock_conn):
+    """Migration refusée si déjà faite ; archivage détaché puis cube recalculé"""
+    mock_cursor = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+    mock_cursor.fetchone.return_value = (True,)
+    with patch('backend.ensure_schema', return_value=True):
+        assert backend.migrate_to_partitions() is False
+    with patch('backend.rebuild_geo_cube', return_value=True) as mock_rebuild:
+        assert backend.archive_partition(2019) is True
+    mock_rebuild.assert_called_once()
+    assert "DETACH PARTITION entretien_2019" in mock_cursor.execute.call_args[0][0]
+
+# =================================================================
+#  TESTS MOTEUR ANALYTIQUE EMBARQUÉ
+# =================================================================
+
+def test_analytics_plan_sync():
+    """Incrément si nouveaux num ou lignes modifiées, copie complète si suppressions ou décodage modifié"""
+    t0, t1 = datetime(2026, 1, 1, tzinfo=timezone.utc), datetime(2026, 1, 2, tzinfo=timezone.utc)
+    meta = {'watermark': 10, 'nb': 8, 'version': 'v1', 'maj': t0}
+    remote = {'nb': 8, 'max_num': 10, 'max_maj': t0}
+    assert analytics.plan_sync(None, 'v1', remote) == analytics.SYNC_FULL
+    assert analytics.plan_sync(meta, 'v2', remote) == analytics.SYNC_FULL
+    assert analytics.plan_sync(meta, 'v1', dict(remote, nb=7, max_num=12)) == analytics.SYNC_FULL
+    assert analytics.plan_sync(meta, 'v1', dict(remote, max_num=12)) == analytics.SYNC_INCREMENT
+    assert analytics.plan_sync(meta, 'v1', dict(remote, max_maj=t1)) == analytics.SYNC_INCREMENT
+    assert analytics.plan_sync(meta, 'v1', remote) == analytics.SYNC_NONE
+    assert analytics.maps_version({1: 'a'}, {1: {'1': 'X'}}) != analytics.maps_version({1: 'a'}, {1: {'1': 'Y'}})
+
+def test_analytics_sync_throttled():
+    """Dans le délai : aucune requête PostgreSQL"""
+    with patch('analytics.get_connection', return_value=MagicMock()), \
+         patch('analytics._last_sync', {'at': analytics.time.monotonic()}), \
+         patch('analytics.backend.get_reporting_connection') as mock_pg:
+        assert analytics.sync() == 0
+    mock_pg.assert_not_called()
+
+def test_analytics_query_builders():
+    """Seules les colonnes de la copie locale entrent dans le SQL"""
+    columns = ['num', 'sexe', 'age']
+    sql = analytics.build_aggregate_query(['sexe'], columns, 'age', 'mean')
+    assert 'AVG(TRY_CAST("age" AS DOUBLE)) AS "age"' in sql and 'GROUP BY "sexe"' in sql
+    assert 'COUNT(*) AS "Compte"' in analytics.build_aggregate_query(['sexe'], columns)
+    assert 'quantile_cont' in analytics.build_quantile_query('age', columns, by=['sexe'])
+    with pytest.raises(ValueError):
+        analytics.build_aggregate_query(['sexe; DROP TABLE x'], columns)
+
+def test_analytics_engine_roundtrip():
+    """Copie complète par lots puis incrément (ligne nouvelle et ligne modifiée) dans une base DuckDB en mémoire"""
+    duckdb = pytest.importorskip("duckdb")
+    t0, t1 = datetime(2026, 1, 1, tzinfo=timezone.utc), datetime(2026, 1, 2, tzinfo=timezone.utc)
+    maps = ({'sexe': 5}, {5: {'1': 'F', '2': 'H'}}, {'sexe': {'type': 'MOD'}, 'age': {'type': 'NUM'}})
+    pg = MagicMock()
+    server = pg.cursor.return_value
+    server.fetchmany.side_effect = [
+        [{'num': 1, 'sexe': '1', 'age': None, 'maj': t0}], [{'num': 2, 'sexe': '2', 'age': 40, 'maj': t0}], [],
+        # Incrément : num 1 modifié, num 3 nouveau
+        [{'num': 1, 'sexe': '1', 'age': 30, 'maj': t1}, {'num': 3, 'sexe': '1', 'age': 50, 'maj': t1}], [],
+    ]
+    with patch('analytics._connection', duckdb.connect(':memory:')), patch('analytics.SYNC_BATCH_ROWS', 1):
+        con = analytics.get_connection()
+        assert analytics._read_meta(con) is None
+        assert analytics._copy(con, pg, analytics.SYNC_FULL, None, maps, 'v1') == 2
+        meta = analytics._read_meta(con)
+        assert meta == {'watermark': 2, 'nb': 2, 'version': 'v1', 'maj': t0}
+        assert analytics._copy(con, pg, analytics.SYNC_INCREMENT, meta, maps, 'v1') == 2
+        assert "num > %s OR maj > %s" in server.execute.call_args[0][0]
+        assert analytics._read_meta(con) == {'watermark': 3, 'nb': 3, 'version': 'v1', 'maj': t1}
+
+        counts = analytics.aggregate(['sexe'])
+        assert counts.set_index('sexe')['Compte'].to_dict() == {'F': 2, 'H': 1}
+        assert analytics.aggregate(['sexe'], 'age', 'mean').set_index('sexe')['age'].to_dict() == {'F': 40.0, 'H': 40.0}
+        stats = analytics.quantiles('age')
+        assert stats.loc[0, 'mediane'] == 40 and stats.loc[0, 'nb'] == 3
+        assert analytics.crosstab('sexe', 'age').loc['F', 50] == 1
+        assert analytics.aggregate(['inconnue']) is None
+
+def test_analytics_unavailable():
+    """Sans duckdb : aucune copie, les graphiques restent calculés par pandas"""
+    with patch('analytics.duckdb', None), patch('analytics._connection', None):
+        assert analytics.is_available() is False
+        assert analytics.sync() is None
+        assert analytics.aggregate(['sexe']) is None
+        assert analytics.crosstab('sexe', 'age') is None
+
+def test_box_from_quantiles():
+    """Une trace par groupe de couleur, tracée à partir des seules statistiques"""
+    stats = pd.DataFrame({'sexe': ['F', 'H'], 'mode': ['RDV', 'RDV'], 'min': [0, 1], 'q1': [1, 2],
+                          'mediane': [2, 3], 'q3': [3, 4], 'max': [5, 6], 'nb': [10, 12]})
+    fig = charts.box_from_quantiles(stats, 'sexe', 'age', color='mode', palette=['#000'])
+    assert len(fig.data) == 1 and list(fig.data[0].median) == [2, 3]
+
+def test_large_chart_helpers():
+    """Mode grands volumes : échantillon WebGL reproductible, classes et quartiles précalculés"""
+    df = pd.DataFrame({'sexe': ['F', 'H'] * 50, 'duree': [float(i) for i in range(100)]})
+    assert charts.is_large(df, threshold=99) and not charts.is_large(df, threshold=100)
+
+    fig = charts.scatter_gl(df, 'sexe', 'duree', max_points=10, title="Durées")
+    assert type(fig.data[0]).__name__ == 'Scattergl'
+    assert sum(len(trace.x) for trace in fig.data) == 10 and "10 points sur 100" in fig.layout.title.text
+    assert charts.sample_points(df, 10).index.equals(charts.sample_points(df, 10).index)
+
+    binned = charts.bin_numeric(df, 'duree', bins=4)
+    assert sorted(binned['duree'].unique()) == [12.375, 37.125, 61.875, 86.625]
+    assert charts.bin_numeric(df, 'sexe', bins=4) is df
+
+    stats = charts.quantile_summary(df, 'duree', ['sexe'])
+    assert stats.loc[0, 'mediane'] == df[df['sexe'] == 'F']['duree'].median() and stats['nb'].tolist() == [50, 50]
+
+    # Camembert : deux parts pré-comptées au lieu de 100 lignes, mêmes proportions
+    pie = charts.pie_chart(df, 'sexe', threshold=99)
+    assert list(pie.data[0].labels) == ['F', 'H'] and list(pie.data[0].values) == [50, 50]
+    assert len(charts.pie_chart(df, 'sexe', threshold=100).data[0].labels) == 100
+
+# =================================================================
+#  TESTS AGRÉGATION PARALLÈLE
+# =================================================================
+
+def test_aggregation_partials():
+    """Tranches contiguës ; les agrégats partiels d'un même groupe s'additionnent"""
+    assert aggregation.split_ranges(10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert aggregation.split_ranges(2, 4) == [(0, 1), (1, 2)]
+    df = pd.DataFrame({'sexe': ['F', 'H', None, 'F'], 'age': [1.0, 2.0, 5.0, np.nan]})
+    first = aggregation.partial_aggregate(df.iloc[:2], ['sexe'], 'age')
+    second = aggregation.partial_aggregate(df.iloc[2:], ['sexe'], 'age')
+    merged = aggregation.merge_partials([first, second], ['sexe'])
+    # Clé manquante ignorée comme dans groupby ; valeur manquante comptée dans aucun groupe
+    assert merged.to_dict('index') == {'F': {'sum': 1.0, 'count': 1}, 'H': {'sum': 2.0, 'count': 1}}
+
+def test_aggregation_matches_pandas():
+    """Même résultat que le groupby pandas (clés catégorielles ou non, valeurs manquantes)"""
+    df = pd.DataFrame({'sexe': pd.Categorical(['F', 'H', 'F', None, 'H', 'F']),
+                       'mode': ['RDV', 'Tel', 'RDV', 'RDV', None, 'Tel'],
+                       'age': [30, 40, np.nan, 50, 60, 20]})
+    for how, value in [('count', None), ('mean', 'age'), ('sum', 'age')]:
+        result = aggregation.aggregate(df, ['sexe', 'mode'], value, how, workers=2, min_rows=0)
+        expected = aggregation._pandas_aggregate(df, ['sexe', 'mode'], value, how)
+        column = value or aggregation.COUNT_COLUMN
+        assert result[['sexe', 'mode']].astype(str).values.tolist() == expected[['sexe', 'mode']].astype(str).values.tolist()
+        assert np.allclose(result[column], expected[column])
+
+    # Somme d'une colonne entière (ou booléenne) : même type entier que pandas
+    df['enfant'] = [1, 2, 0, 3, 1, 2]
+    df['couple'] = [True, False, True, True, False, True]
+    for value in ['enfant', 'couple']:
+        result = aggregation.aggregate(df, ['sexe'], value, 'sum', workers=2, min_rows=0)
+        expected = aggregation._pandas_aggregate(df, ['sexe'], value, 'sum')
+        assert result[value].dtype == expected[value].dtype == np.int64
+        assert result[value].tolist() == expected[value].tolist()
+
+def test_aggregation_broken_pool_reset():
+    """Processus du pool tué : repli sur pandas et pool recréé à l'appel suivant"""
+    from concurrent.futures.process import BrokenProcessPool
+    df = pd.DataFrame({'sexe': ['F', 'H', 'F']})
+    broken = MagicMock()
+    broken.submit.side_effect = BrokenProcessPool("processus tué")
+    with patch('aggregation._executor', broken):
+        result = aggregation.aggregate(df, ['sexe'], workers=2, min_rows=0)
+        assert aggregation._executor is None
+    broken.shutdown.assert_called_once()
+    assert result[aggregation.COUNT_COLUMN].tolist() == [2, 1]
+
+def test_aggregation_small_frame_uses_pandas():
+    df = pd.DataFrame({'sexe': ['F', 'H', 'F']})
+    with patch('aggregation._get_executor') as mock_pool:
+        result = aggregation.aggregate(df, ['sexe'])
+        # Un seul cœur : aucun gain possible, pas de pool
+        aggregation.aggregate(df, ['sexe'], workers=1, min_rows=0)
+    mock_pool.assert_not_called()
+    assert result[aggregation.COUNT_COLUMN].tolist() == [2, 1]
 
 # =================================================================
 #  TESTS DE GESTION D'ERREURS
@@ -149,6 +957,20 @@ def test_db_exceptions(mock_conn):
     assert backend.upsert_rubrique(1, 1, "A") is False
     assert backend.add_variable_sql("A", "B", 1, 1, "C") is False
     assert backend.get_data_for_reporting().empty
+    assert backend.ensure_schema() is False
+    assert backend.get_geo_rollup('AGGLO').empty
+    page = backend.get_entretiens_page()
+    assert page['rows'].empty and page['error'] is True
+    assert backend.audit_entretiens() is None
+    assert backend.validate_entretiens(pd.DataFrame()) is None
+    with patch('backend._validation_cache', {'at': 0.0, 'rules': None}):
+        assert backend.check_entretien({'sexe': '1'}) is None
+    assert backend.get_autocomplete_indexes() == {}
+    with patch('backend._geo_reference', None):
+        assert backend.resolve_communes_history() is None
+    assert backend.ensure_partitions() is False
+    assert backend.archive_partition(2019) is False
+    assert backend.list_partitions().empty
 
 def test_connection_none():
     """Vérifie le comportement si la connexion est perdue (None)"""
@@ -161,4 +983,10 @@ def test_connection_none():
         assert backend.insert_solutions(1, []) is None
         assert backend.upsert_rubrique(1, 1, "A") is False
         assert backend.add_variable_sql("A", "B", 1, 1, "C") is False
-        assert backend.get_data_for_reporting().empty
\ No newline at end of file
+        assert backend.get_data_for_reporting().empty
+        assert backend.ensure_schema() is False
+        assert backend.rebuild_geo_cube() is False
+        assert backend.resolve_communes_history() is None
+        assert backend.ensure_partitions() is False
+        assert backend.migrate_to_partitions() is False
+        assert backend.list_partitions().empty
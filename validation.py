@@ -0,0 +1,108 @@
+# =================================================================
+#  CONTRÔLE DES DONNÉES D'ENTRETIEN PAR LES RÈGLES DU QUESTIONNAIRE
+# =================================================================
+# Les métadonnées (variable, modalite, plage, valeurs_c) sont compilées une
+# fois en règles par colonne, puis chaque règle est appliquée à une colonne
+# entière d'un coup (masques pandas) : aucun parcours ligne à ligne.
+
+import pandas as pd
+
+REGLE_OBLIGATOIRE = 'obligatoire'
+REGLE_CODE_INCONNU = 'code_inconnu'
+REGLE_NON_NUMERIQUE = 'non_numerique'
+REGLE_HORS_PLAGE = 'hors_plage'
+REGLE_HORS_LISTE = 'hors_liste'
+# Règles qui empêchent l'enregistrement ; hors_liste reste un simple signalement
+# (une valeur nouvelle est permise dans les champs texte)
+REGLES_BLOQUANTES = frozenset({REGLE_OBLIGATOIRE, REGLE_CODE_INCONNU, REGLE_NON_NUMERIQUE, REGLE_HORS_PLAGE})
+
+VIOLATION_COLUMNS = ['ligne', 'num', 'colonne', 'valeur', 'regle']
+
+
+def compile_rules(variables, modalites, plages, valeurs_c, required=()):
+    """
+    Règles par colonne (lib en minuscules) à partir des lignes des tables de
+    métadonnées. Le questionnaire ne dit pas quelles variables sont
+    obligatoires (variable.est_contrainte choisit seulement le type de
+    liste) : required donne explicitement leurs libellés.
+    """
+    required = {lib.lower() for lib in required}
+    codes, bornes, listes = {}, {}, {}
+    for row in modalites:
+        codes.setdefault(row['pos'], set()).add(str(row['code']).strip())
+    for row in plages:
+        bornes[row['pos']] = (row['val_min'], row['val_max'])
+    for row in valeurs_c:
+        listes.setdefault(row['pos'], set()).add(str(row['lib']).strip())
+
+    rules = {}
+    for var in variables:
+        pos = var['pos']
+        val_min, val_max = bornes.get(pos, (None, None))
+        rules[var['lib'].lower()] = {
+            'type': var['type_v'],
+            'required': var['lib'].lower() in required,
+            'codes': frozenset(codes[pos]) if var['type_v'] == 'MOD' and pos in codes else None,
+            'min': val_min,
+            'max': val_max,
+            'valeurs': frozenset(listes[pos]) if var['type_v'] == 'CHAINE' and pos in listes else None,
+        }
+    return rules
+
+
+def _as_text(series):
+    """Texte comparable aux codes : 1.0 -> '1', espaces retirés"""
+    if pd.api.types.is_numeric_dtype(series):
+        try:
+            return series.astype('Int64').astype('string')
+        except (TypeError, ValueError):
+            pass
+    return series.astype('string').str.strip()
+
+
+def validate_frame(df, rules):
+    """Toutes les violations du DataFrame : une ligne par (ligne, colonne, règle)"""
+    found = []
+
+    def add(mask, col, regle):
+        if mask.any():
+            hits = df.loc[mask, [col]].rename(columns={col: 'valeur'})
+            hits['ligne'] = hits.index
+            hits['num'] = df.loc[mask, 'num'] if 'num' in df.columns else None
+            hits['colonne'] = col
+            hits['regle'] = regle
+            found.append(hits)
+
+    for col, rule in rules.items():
+        if col not in df.columns: continue
+        text = _as_text(df[col])
+        present = (text.notna() & (text != '')).fillna(False).astype(bool)
+
+        if rule['required']:
+            add(~present, col, REGLE_OBLIGATOIRE)
+        if rule['codes']:
+            add(present & ~text.isin(rule['codes']).fillna(False).astype(bool), col, REGLE_CODE_INCONNU)
+        if rule['type'] == 'NUM':
+            numbers = pd.to_numeric(df[col], errors='coerce')
+            add(present & numbers.isna(), col, REGLE_NON_NUMERIQUE)
+            out_of_range = pd.Series(False, index=df.index)
+            if rule['min'] is not None: out_of_range |= numbers < rule['min']
+            if rule['max'] is not None: out_of_range |= numbers > rule['max']
+            add(out_of_range.fillna(False).astype(bool), col, REGLE_HORS_PLAGE)
+        if rule['valeurs']:
+            add(present & ~text.isin(rule['valeurs']).fillna(False).astype(bool), col, REGLE_HORS_LISTE)
+
+    if not found: return pd.DataFrame(columns=VIOLATION_COLUMNS)
+    return pd.concat(found, ignore_index=True)[VIOLATION_COLUMNS]
+
+
+def summarize_violations(violations):
+    """Nombre de violations par colonne et par règle"""
+    return violations.groupby(['colonne', 'regle']).size().reset_index(name='nb').sort_values('nb', ascending=False)
+
+
+def valid_rows(df, violations, regles_bloquantes=None):
+    """Lignes importables : sans violation (ou sans violation des règles données)"""
+    if regles_bloquantes is not None:
+        violations = violations[violations['regle'].isin(regles_bloquantes)]
+    return df.loc[~df.index.isin(violations['ligne'])]
@@ -0,0 +1,121 @@
+"""
+Worker de précalcul du tableau de bord, à lancer à côté de l'application :
+
+    python worker.py
+
+Il recharge et décode les entretiens, calcule les indicateurs et les
+graphiques de la VUE GLOBALE puis les publie dans le stockage local
+(snapshot.py). Le rafraîchissement a lieu à chaque notification PostgreSQL
+(NOTIFY émis par les saisies et les changements de configuration) et au
+plus tard toutes les WORKER_REFRESH_INTERVAL secondes. Les pages ne font
+plus que lire le résultat : le travail lourd tourne dans ce processus,
+sur un autre cœur que le serveur web.
+
+Une erreur (connexion perdue, PostgreSQL redémarré) n'arrête pas le
+worker : elle est journalisée, puis les connexions sont rouvertes après
+une attente croissante (au plus WORKER_MAX_BACKOFF secondes).
+"""
+import os
+import select
+import time
+from datetime import date
+
+import backend
+import charts
+import snapshot
+
+REFRESH_INTERVAL = int(os.getenv("WORKER_REFRESH_INTERVAL", "300"))
+# Regroupe une rafale de saisies en un seul recalcul
+DEBOUNCE = float(os.getenv("WORKER_DEBOUNCE", "2"))
+MAX_BACKOFF = float(os.getenv("WORKER_MAX_BACKOFF", "60"))
+
+
+def refresh():
+    start = time.perf_counter()
+    df = backend.get_data_for_reporting()
+    if df.empty:
+        # Base injoignable ou vide : on conserve le dernier précalcul publié
+        print("⚠️ Aucune donnée, précalcul non publié.")
+        return False
+    snapshot.publish(snapshot.REPORTING, {
+        'df': df,
+        'kpis': charts.compute_kpis(df),
+        'figures': charts.build_global_figures(df),
+    })
+    print(f"✅ Précalcul publié : {len(df)} entretiens en {time.perf_counter() - start:.2f} s")
+    return True
+
+
+def listen_connection():
+    conn = backend.init_connection()
+    if conn is None: return None
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute(f"LISTEN {backend.NOTIFY_CHANNEL}")
+    cursor.close()
+    return conn
+
+
+def _drain(conn):
+    conn.poll()
+    nb = len(conn.notifies)
+    conn.notifies.clear()
+    return nb
+
+
+def wait_for_change(conn, timeout):
+    """Attend une notification (True) ou l'expiration du délai (False)"""
+    if conn is None:
+        time.sleep(timeout)
+        return False
+    if select.select([conn], [], [], timeout) == ([], [], []):
+        return False
+    _drain(conn)
+    time.sleep(DEBOUNCE)
+    _drain(conn)
+    return True
+
+
+def _close(conn):
+    try:
+        if conn is not None: conn.close()
+    except Exception:
+        pass
+
+
+def run_iteration(conn, state):
+    """
+    Un tour de boucle ; renvoie la connexion LISTEN à utiliser au tour suivant.
+    state : {'partitions_day': date de la dernière vérification des partitions}
+    """
+    backend.reconnect()
+    if conn is None or conn.closed:
+        conn = listen_connection()
+        if conn is None:
+            print("⚠️ LISTEN impossible : rafraîchissement périodique uniquement.")
+        # (Re)connexion : des notifications ont pu être perdues, on recalcule tout de suite
+        refresh()
+    # Partitions des années à venir vérifiées une fois par jour (processus de longue durée)
+    if state.get('partitions_day') != date.today() and backend.ensure_partitions():
+        state['partitions_day'] = date.today()
+    wait_for_change(conn, REFRESH_INTERVAL)
+    refresh()
+    return conn
+
+
+def main():  # pragma: no cover
+    conn, state, backoff = None, {}, 1
+    while True:
+        try:
+            conn = run_iteration(conn, state)
+            backoff = 1
+        except Exception as e:
+            print(f"❌ ERREUR WORKER : {e} (nouvel essai dans {backoff:.0f} s)")
+            _close(conn)
+            conn = None
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()